@@ -0,0 +1,125 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import numpy as np
+
+ANSWER_CACHE_PATH = "embeddings/answer_cache.sqlite"
+SIMILARITY_THRESHOLD = 0.95    # cosine similarity between question embeddings
+TTL_SECONDS = 7 * 24 * 3600
+MAX_ENTRIES = 10000
+
+
+def chunk_key(chunks):
+    # digest of the retrieved chunks: an answer is only reused for the same grounding context
+    h = hashlib.sha1()
+    for chunk in sorted(chunks):
+        h.update(chunk.encode("utf-8"))
+        h.update(b"\0")
+    return h.hexdigest()
+
+
+def _unit(vector):
+    vector = np.asarray(vector, dtype="float32").ravel()
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+class SemanticAnswerCache:
+    # SQLite-backed cache of generated answers, hit when a new question's embedding is
+    # close enough to a cached one retrieved against the same chunks.
+    def __init__(self, path=ANSWER_CACHE_PATH, threshold=SIMILARITY_THRESHOLD,
+                 ttl_seconds=TTL_SECONDS, max_entries=MAX_ENTRIES):
+        self.threshold = threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS answers (
+                id INTEGER PRIMARY KEY,
+                chunk_key TEXT NOT NULL,
+                embedding BLOB NOT NULL,
+                question TEXT,
+                answer TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                last_used REAL NOT NULL
+            )""")
+        self._db.execute("CREATE INDEX IF NOT EXISTS answers_chunk_key ON answers (chunk_key)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS answers_last_used ON answers (last_used)")
+        self._db.commit()
+
+    def get(self, embedding, chunks):
+        now = time.time()
+        query = _unit(embedding)
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT id, embedding, answer FROM answers WHERE chunk_key = ? AND created_at >= ?",
+                (chunk_key(chunks), now - self.ttl_seconds)).fetchall()
+            best_id, best_answer, best_sim = None, None, self.threshold
+            if rows:
+                matrix = np.frombuffer(b"".join(r[1] for r in rows), dtype="float32").reshape(len(rows), -1)
+                sims = matrix @ query
+                i = int(np.argmax(sims))
+                if sims[i] >= best_sim:
+                    best_id, best_answer = rows[i][0], rows[i][2]
+
+            if best_id is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._db.execute("UPDATE answers SET last_used = ? WHERE id = ?", (now, best_id))
+            self._db.commit()
+            return best_answer
+
+    def put(self, embedding, chunks, answer, question=None):
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT INTO answers (chunk_key, embedding, question, answer, created_at, last_used) VALUES (?, ?, ?, ?, ?, ?)",
+                (chunk_key(chunks), _unit(embedding).tobytes(), question, answer, now, now))
+            self._evict(now)
+            self._db.commit()
+
+    def _evict(self, now):
+        # drop expired rows, then least recently used ones beyond max_entries
+        self._db.execute("DELETE FROM answers WHERE created_at < ?", (now - self.ttl_seconds,))
+        self._db.execute(
+            "DELETE FROM answers WHERE id IN (SELECT id FROM answers ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,))
+
+    def clear(self):
+        with self._lock:
+            self._db.execute("DELETE FROM answers")
+            self._db.commit()
+
+    def stats(self):
+        with self._lock:
+            size = self._db.execute("SELECT COUNT(*) FROM answers").fetchone()[0]
+        total = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses, "hit_rate": self.hits / total if total else 0.0, "size": size}
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_answer_cache():
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = SemanticAnswerCache()
+    return _cache
+
+
+def set_answer_cache(cache):
+    # lets tests/benchmarks swap in e.g. SemanticAnswerCache(":memory:")
+    global _cache
+    _cache = cache
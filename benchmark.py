@@ -0,0 +1,250 @@
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+import numpy as np
+
+RESULTS_DIR = "benchmarks/results"
+BASE_DATE = date(2025, 1, 1)    # fixed so rosters are identical across runs and machines
+REGRESSION_TOLERANCE = 0.10
+
+# Synthetic nephrology-flavoured corpus: sentences built from these, so BM25 and the embedder
+# both have something to match on
+TERMS = ["creatinine", "GFR", "proteinuria", "albumin", "dialysis", "hemodialysis", "nephron", "glomerulus",
+         "potassium", "sodium", "phosphate", "edema", "hypertension", "ACE inhibitor", "diuretic", "anemia",
+         "erythropoietin", "fistula", "transplant", "biopsy", "nephrotic syndrome", "uremia", "acidosis",
+         "urine output", "blood pressure", "statin", "prednisolone", "kidney stones", "fluid restriction"]
+VERBS = ["raises", "lowers", "indicates", "is monitored with", "is treated by", "worsens", "protects against",
+         "is measured alongside", "can be caused by", "should be discussed with"]
+FILLER = ["patients", "after discharge", "in chronic kidney disease", "every week", "at the clinic",
+          "with diet changes", "in older adults", "during follow-up", "when symptoms persist", "in stage 3"]
+OFF_TOPIC = ["Who won the football match yesterday?", "What is the capital of Australia?",
+             "How do I reset my router password?", "Recommend a good science fiction novel",
+             "What time does the pharmacy open on Sunday?", "How tall is Mount Everest?"]
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def latency_summary(seconds, wall=None):
+    ms = np.asarray(seconds) * 1000
+    summary = {"n": len(ms), "mean_ms": float(ms.mean()), "p50_ms": float(np.percentile(ms, 50)),
+               "p95_ms": float(np.percentile(ms, 95)), "p99_ms": float(np.percentile(ms, 99))}
+    summary["per_s"] = len(ms) / (wall if wall is not None else ms.sum() / 1000)
+    return summary
+
+
+def time_each(fn, items):
+    out = []
+    for item in items:
+        start = time.perf_counter()
+        fn(item)
+        out.append(time.perf_counter() - start)
+    return out
+
+
+def synthetic_corpus(n_chunks, seed=0, sentences_per_chunk=6):
+    rng = random.Random(seed)
+    return [" ".join(f"{rng.choice(TERMS).capitalize()} {rng.choice(VERBS)} {rng.choice(TERMS)} {rng.choice(FILLER)}."
+                     for _ in range(sentences_per_chunk))
+            for _ in range(n_chunks)]
+
+
+def synthetic_questions(corpus, n, seed=0, off_topic=0.2):
+    # On-topic questions paraphrase half of a corpus chunk, so they retrieve it; the rest need the web.
+    rng = random.Random(seed)
+    questions = []
+    for _ in range(n):
+        if rng.random() < off_topic:
+            questions.append(rng.choice(OFF_TOPIC))
+        else:
+            sentences = rng.choice(corpus).split(". ")
+            questions.append("What does it mean that " + ". ".join(sentences[:len(sentences) // 2]).lower() + "?")
+    return questions
+
+
+def bench_lookup(workdir, n_patients, n_lookups, seed=0):
+    from generate_dummy_patients import write_roster
+    from patient_lookup import PatientIndex, find_patient_by_name
+    from patient_store import PatientStore
+
+    path = os.path.join(workdir, "roster.jsonl")
+    start = time.perf_counter()
+    write_roster(path, n_patients, seed, BASE_DATE)
+    PatientStore(path).close()    # first open writes the offset index and name sidecar
+    generate_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    store = PatientStore(path)
+    index = PatientIndex(store)
+    build_s = time.perf_counter() - start
+
+    rng = random.Random(seed)
+    names = [store[rng.randrange(len(store))]["patient_name"] for _ in range(n_lookups)]
+    typos = [name[:-2] + name[-1:] for name in names[:max(1, n_lookups // 10)]]
+    exact = time_each(lambda name: find_patient_by_name(name, index), names)
+    fuzzy = time_each(index.fuzzy_search, typos)
+    store.close()
+    return {"patients": n_patients, "generate_s": generate_s, "index_build_s": build_s,
+            "exact": latency_summary(exact), "fuzzy": latency_summary(fuzzy)}
+
+
+def bench_ingestion(workdir, corpus, index_types, embed_backend):
+    from embedding_backend import make_embedder
+    from process_pdf import batched, save_to_faiss
+
+    embedder = make_embedder(embed_backend)
+    start = time.perf_counter()
+    embeddings = np.vstack([embedder.encode(batch, batch_size=256) for batch in batched(corpus, 256)])
+    embed_s = time.perf_counter() - start
+    results = {"chunks": len(corpus), "embed_s": embed_s, "embed_chunks_per_s": len(corpus) / embed_s, "indexes": {}}
+    for index_type in index_types:
+        start = time.perf_counter()
+        save_to_faiss(embeddings, corpus, os.path.join(workdir, index_type), index_type)
+        results["indexes"][index_type] = {"build_s": time.perf_counter() - start}
+    return results
+
+
+def bench_retrieval(questions):
+    from clinical_agent import retrieve, search_many
+    from model_registry import get_registry
+
+    get_registry().warm_up()
+    found = []
+    single = time_each(lambda q: found.append(len(retrieve(q)[1])), questions)
+    start = time.perf_counter()
+    search_many(questions)
+    batch_s = time.perf_counter() - start
+    return {"hybrid": latency_summary(single), "hit_rate": float(np.mean([n > 0 for n in found])),
+            "batched_search_many": {"n": len(questions), "total_s": batch_s, "per_s": len(questions) / batch_s}}
+
+
+def bench_clinical(questions, concurrency, metrics_path):
+    from clinical_agent import run_clinical_agent
+    from metrics import flush_sink, read_records, summarize
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        start = time.perf_counter()
+        latencies = list(pool.map(lambda q: time_each(run_clinical_agent, [q])[0], questions))
+        wall = time.perf_counter() - start
+    flush_sink()
+    stages = summarize(read_records(metrics_path, "clinical"))
+    return {"concurrency": concurrency, "requests": latency_summary(latencies, wall), **stages}
+
+
+def configure_offline(workdir, index_dir, embed_backend, llm_latency):
+    # Points every agent singleton at throwaway state: stub LLM, fixture web search, in-memory caches
+    from metrics import get_sink, setup_logging
+    # before clinical_agent is imported, so its setup_logging("clinical_agent.log") is a no-op and
+    # synthetic questions never land in the real log
+    setup_logging(os.path.join(workdir, "clinical_agent.log"))
+    from answer_cache import SemanticAnswerCache, set_answer_cache
+    from llm_client import LLMClient, StubBackend, set_llm_client
+    from model_registry import ModelRegistry, set_registry
+    from web_fallback import FixtureProvider, LearnedShard, WebCache, WebFallback, set_web_fallback
+
+    metrics_path = os.path.join(workdir, "metrics.jsonl")
+    get_sink(metrics_path)
+    set_registry(ModelRegistry(embed_backend, index_dir, query_cache_path=":memory:"))
+    set_llm_client(LLMClient(StubBackend(latency=llm_latency)))
+    set_answer_cache(SemanticAnswerCache(":memory:"))
+    provider = FixtureProvider(os.path.join(workdir, "no-fixture.json"), default="Synthetic web answer.")
+    set_web_fallback(WebFallback(provider, WebCache(":memory:"), LearnedShard(os.path.join(workdir, "learned"))))
+    return metrics_path
+
+
+def run_benchmarks(args):
+    with tempfile.TemporaryDirectory(prefix="medai-bench-") as workdir:
+        metrics_path = configure_offline(workdir, os.path.join(workdir, "flat"), args.embed_backend, args.llm_latency)
+        corpus = synthetic_corpus(args.chunks, args.seed)
+        questions = synthetic_questions(corpus, args.questions, args.seed)
+        results = {}
+        if "lookup" in args.only:
+            results["lookup"] = bench_lookup(workdir, args.patients, args.lookups, args.seed)
+        # ingestion always runs: retrieval and clinical search the flat index it builds
+        results["ingestion"] = bench_ingestion(workdir, corpus, ["flat"] + [t for t in args.index_types if t != "flat"],
+                                               args.embed_backend)
+        if "retrieval" in args.only:
+            results["retrieval"] = bench_retrieval(questions)
+        if "clinical" in args.only:
+            results["clinical"] = bench_clinical(questions, args.concurrency, metrics_path)
+    return {"meta": {"commit": git_commit(), "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                     "python": platform.python_version(), "machine": platform.machine(),
+                     "cpus": os.cpu_count(), "args": vars(args)},
+            "results": results}
+
+
+def flatten(results, prefix=""):
+    # {"lookup.exact.p50_ms": ...} for every numeric leaf
+    flat = {}
+    for key, value in results.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(flatten(value, name + "."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[name] = value
+    return flat
+
+
+def compare(old, new, tolerance=REGRESSION_TOLERANCE):
+    # latency/time metrics regress when they grow, throughput (per_s) when it shrinks
+    before, after = flatten(old["results"]), flatten(new["results"])
+    rows = []
+    for name in sorted(before.keys() & after.keys()):
+        if not (name.endswith(("_ms", "_s")) or name.endswith("per_s")) or not before[name]:
+            continue
+        change = after[name] / before[name] - 1
+        worse = change < -tolerance if name.endswith("per_s") else change > tolerance
+        rows.append((name, before[name], after[name], change, worse))
+    return rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline benchmarks: patient lookup, ingestion, retrieval, clinical agent")
+    sub = parser.add_subparsers(dest="command")
+    run = sub.add_parser("run", help="run the benchmarks (default)")
+    run.add_argument("--patients", type=int, default=100_000)
+    run.add_argument("--lookups", type=int, default=2000)
+    run.add_argument("--chunks", type=int, default=5000)
+    run.add_argument("--questions", type=int, default=300)
+    run.add_argument("--index-types", nargs="*", default=["flat", "ivf", "hnsw"])
+    run.add_argument("--embed-backend", default="hash", help="hash (offline), torch, onnx or onnx-int8")
+    run.add_argument("--llm-latency", type=float, default=0.05, help="seconds per stub LLM call")
+    run.add_argument("--concurrency", type=int, default=4)
+    run.add_argument("--seed", type=int, default=0)
+    run.add_argument("--only", nargs="*", default=["lookup", "retrieval", "clinical"])
+    run.add_argument("--out", help=f"result file (default: {RESULTS_DIR}/<commit>-<time>.json)")
+    cmp = sub.add_parser("compare", help="compare two result files")
+    cmp.add_argument("baseline")
+    cmp.add_argument("candidate")
+    cmp.add_argument("--tolerance", type=float, default=REGRESSION_TOLERANCE)
+    args = parser.parse_args()
+
+    if args.command == "compare":
+        with open(args.baseline) as f, open(args.candidate) as g:
+            rows = compare(json.load(f), json.load(g), args.tolerance)
+        for name, old, new, change, worse in rows:
+            print(f"{'❌' if worse else '  '} {name:<48}{old:>12.3f}{new:>12.3f}{change:>+9.1%}")
+        if any(row[-1] for row in rows):
+            raise SystemExit(f"Regressions beyond {args.tolerance:.0%}")
+    else:
+        if args.command is None:
+            args = run.parse_args([])
+        report = run_benchmarks(args)
+        out = args.out or os.path.join(RESULTS_DIR, f"{report['meta']['commit'] or 'unknown'}-{time.strftime('%Y%m%d-%H%M%S')}.json")
+        os.makedirs(os.path.dirname(out) or ".", exist_ok=True)
+        with open(out, "w") as f:
+            json.dump(report, f, indent=2)
+        print(json.dumps(report["results"], indent=2))
+        print(f"✅ Results written to {out}")
@@ -0,0 +1,121 @@
+import json
+import mmap
+import os
+from collections.abc import Mapping
+import numpy as np
+
+# <dir>/chunks.bin          every chunk's UTF-8 bytes back to back
+# <dir>/chunks.offsets.npy  int64[N + 1]; row i is bin[offsets[i]:offsets[i + 1]]
+# <dir>/chunks.ids.npy      int64[N] FAISS ids, ascending, so id -> row is a binary search
+# <dir>/chunks.meta.npy     side table per row: source (index into chunks.sources.json), page, char span
+STORE_FILES = ("chunks.bin", "chunks.offsets.npy", "chunks.ids.npy", "chunks.meta.npy", "chunks.sources.json")
+
+META_DTYPE = np.dtype([("source", "<i4"), ("page", "<i4"), ("start", "<i8"), ("end", "<i8")])
+
+
+def has_chunk_store(directory):
+    return os.path.exists(os.path.join(directory, "chunks.bin"))
+
+
+class ChunkStore(Mapping):
+    # Read-only {faiss id: chunk text} over memory-mapped files. Opening costs nothing,
+    # a lookup decodes only the bytes of that chunk, and every process mapping the
+    # same files shares one page-cached copy.
+    def __init__(self, directory):
+        self.directory = directory
+        path = lambda name: os.path.join(directory, name)
+        with open(path("chunks.bin"), "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            self._blob = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+        self._offsets = np.load(path("chunks.offsets.npy"), mmap_mode="r")
+        self._ids = np.load(path("chunks.ids.npy"), mmap_mode="r")
+        self._meta = np.load(path("chunks.meta.npy"), mmap_mode="r")
+        with open(path("chunks.sources.json")) as f:
+            self._sources = json.load(f)
+        # a plain build stores ids 0..N-1, where the id is the row
+        self._dense = len(self._ids) == 0 or (self._ids[0] == 0 and self._ids[-1] == len(self._ids) - 1)
+
+    def _row(self, key):
+        key = int(key)
+        if self._dense:
+            if 0 <= key < len(self._ids):
+                return key
+        else:
+            row = int(np.searchsorted(self._ids, key))
+            if row < len(self._ids) and self._ids[row] == key:
+                return row
+        raise KeyError(key)
+
+    def __getitem__(self, key):
+        row = self._row(key)
+        return self._blob[int(self._offsets[row]):int(self._offsets[row + 1])].decode("utf-8")
+
+    def __iter__(self):
+        return (int(i) for i in self._ids)
+
+    def __len__(self):
+        return len(self._ids)
+
+    def meta(self, key):
+        # {"source", "page", "start", "end"} of a chunk, or None when it was stored without metadata
+        m = self._meta[self._row(key)]
+        if m["source"] < 0:
+            return None
+        return {"source": self._sources[m["source"]], "page": int(m["page"]), "start": int(m["start"]), "end": int(m["end"])}
+
+    def close(self):
+        if isinstance(self._blob, mmap.mmap):
+            self._blob.close()
+
+
+def write_chunk_store(directory, ids, texts, metas=None):
+    # metas: per chunk (source, page, start, end) or None; rows are written sorted by id
+    os.makedirs(directory, exist_ok=True)
+    ids = np.asarray(ids, dtype="int64")
+    order = np.argsort(ids, kind="stable")
+    texts = list(texts)
+    metas = list(metas) if metas is not None else [None] * len(texts)
+
+    sources = []
+    source_ids = {}
+    offsets = np.zeros(len(ids) + 1, dtype="int64")
+    meta = np.zeros(len(ids), dtype=META_DTYPE)
+    tmp = lambda name: os.path.join(directory, name + ".tmp")
+
+    with open(tmp("chunks.bin"), "wb") as blob:
+        for row, i in enumerate(order):
+            data = texts[i].encode("utf-8", errors="replace")
+            blob.write(data)
+            offsets[row + 1] = offsets[row] + len(data)
+            m = metas[i]
+            if m is None:
+                meta[row] = (-1, -1, -1, -1)
+            else:
+                source, page, start, end = m
+                if source not in source_ids:
+                    source_ids[source] = len(sources)
+                    sources.append(source)
+                meta[row] = (source_ids[source], page, start, end)
+
+    # np.save appends ".npy" unless the name already ends with it, so save through file handles
+    for name, array in (("chunks.offsets.npy", offsets), ("chunks.ids.npy", ids[order]), ("chunks.meta.npy", meta)):
+        with open(tmp(name), "wb") as f:
+            np.save(f, array)
+    with open(tmp("chunks.sources.json"), "w") as f:
+        json.dump(sources, f)
+
+    for name in STORE_FILES:
+        os.replace(tmp(name), os.path.join(directory, name))
+
+
+def read_chunk_store(directory):
+    # ({id: text}, {id: meta tuple}) for callers that rewrite the store, e.g. incremental ingest
+    store = ChunkStore(directory)
+    chunks, metas = {}, {}
+    for key in store:
+        chunks[key] = store[key]
+        m = store.meta(key)
+        if m is not None:
+            metas[key] = [m["source"], m["page"], m["start"], m["end"]]
+    store.close()
+    return chunks, metas
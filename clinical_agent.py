@@ -1,81 +1,208 @@
-import faiss
-import pickle
 import numpy as np
 import logging
-import requests
-from sentence_transformers import SentenceTransformer
-from llm_engine import generate_answer  # This calls Mistral locally via llama-cpp
+import time
+from metrics import Trace, setup_logging, stage
+from model_registry import get_registry
+from answer_cache import get_answer_cache
+from web_fallback import get_web_fallback
+from retrieval import hybrid_search
+from context_builder import build_context
+from llm_engine import generate_answer, stream_answer, clean_answer  # Gemini, local llama-cpp or offline stub (see llm_client)
+from llm_client import LLMError
 
-# Setup logging
-logging.basicConfig(filename="clinical_agent.log", level=logging.INFO)
+# Setup logging (queued, so file writes never hold up a reply)
+setup_logging("clinical_agent.log")
 
-# Load FAISS index and stored chunks
+# Load FAISS index and stored chunks (cached per process, reloaded if the files change)
 def load_faiss_data():
-    index = faiss.read_index("embeddings/faiss_index/faiss.index")
-    with open("embeddings/faiss_index/chunks.pkl", "rb") as f:
-        chunks = pickle.load(f)
-    return index, chunks
+    return get_registry().get_index()
+
+# Embed questions using MiniLM (same as used in chunking), one batched encode call
+def embed_questions(questions, model, batch_size=64):
+    return np.asarray(model.encode(list(questions), batch_size=batch_size), dtype="float32")
 
-# Embed the question using MiniLM (same as used in chunking)
 def embed_question(question, model):
-    return model.encode([question])[0]
+    return embed_questions([question], model)[0]
 
-# Filter chunks by FAISS similarity threshold
-def search_chunks(question_embedding, index, chunks, top_k=5, threshold=0.8):
-    D, I = index.search(np.array([question_embedding]), top_k)
-    print("🔍 FAISS distances:", D[0])  # For debugging
+# One FAISS search for the whole query matrix; the threshold is applied as a mask
+def search_ids_many(query_embeddings, index, top_k=5, threshold=0.8):
+    D, I = index.search(np.ascontiguousarray(query_embeddings, dtype="float32"), top_k)
+    mask = (D < threshold) & (I >= 0)  # FAISS pads missing results with -1
+    return D, I, mask
 
-    relevant_chunks = []
-    for distance, idx in zip(D[0], I[0]):
-        if distance < threshold:
-            relevant_chunks.append(chunks[idx])
+def search_embeddings(query_embeddings, index, chunks, top_k=5, threshold=0.8):
+    D, I, mask = search_ids_many(query_embeddings, index, top_k, threshold)
+    logging.debug(f"FAISS distances: {D}")
+    return [[chunks[idx] for idx in row[keep]] for row, keep in zip(I, mask)]
 
-    return relevant_chunks
+def search_many(questions, top_k=5, threshold=0.8):
+    registry = get_registry()
+    index, chunks = registry.get_index()
+    embeddings = embed_questions(questions, registry.get_query_encoder())
+    return search_embeddings(embeddings, index, chunks, top_k, threshold)
 
-# Tavily web search fallback
-def fallback_web_search(query):
-    API_KEY = "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"
-    headers = {"Authorization": f"Bearer {API_KEY}"}
-    json = {"query": query, "search_depth": "basic"}
-    response = requests.post("https://api.tavily.com/search", headers=headers, json=json)
+# Filter chunks by FAISS similarity threshold
+def search_chunks(question_embedding, index, chunks, top_k=5, threshold=0.8):
+    return search_embeddings(np.asarray([question_embedding]), index, chunks, top_k, threshold)[0]
 
-    if response.status_code == 200:
-        return response.json()["results"][0]["content"]
-    return "No relevant information found on the web."
+# Web search fallback: learned shard, response cache, then Tavily (see web_fallback)
+def fallback_web_search(query, embedding=None):
+    with stage("web_fallback"):
+        return get_web_fallback().search(query, embedding)
 
-def run_clinical_agent(question):
-    if question.strip().lower() in ["bye", "exit", "thank you", "thanks"]:
-        return ("I'm glad I could help! Take care and follow up with your doctor. 👋", "Session Ended")
+EXIT_WORDS = ["bye", "exit", "thank you", "thanks"]
+FAREWELL = "I'm glad I could help! Take care and follow up with your doctor. 👋"
+FOLLOWUP_PROMPT = "\n\nHow else can I assist you today?"
+PDF_SOURCE = "📘 Source: Nephrology PDF"
+WEB_SOURCE = "🌐 Source: Web (Tavily)"
 
-    model = SentenceTransformer("all-MiniLM-L6-v2")
+# Hybrid retrieval: FAISS + BM25 fused with RRF, optional rerank, overlapping chunks merged
+def retrieve(question):
+    registry = get_registry()
+    model = registry.get_query_encoder()
     index, chunks = load_faiss_data()
+    bm25 = registry.get_bm25()
 
-    q_embedding = embed_question(question, model)
-    top_chunks = search_chunks(q_embedding, index, chunks, top_k=5, threshold=0.8)
-
-    if not top_chunks:
-        logging.warning(f"No relevant chunks found for: {question}")
-        answer = fallback_web_search(question)
-        source = "🌐 Source: Web (Tavily)"
-    else:
-        context = "\n\n".join(top_chunks)
-        answer = generate_answer(context, question)
-        answer = answer.replace("```", "")  # prevent accidental code blocks
-        answer = answer.replace("    ", "")  # remove excessive indentation
-        source = "📘 Source: Nephrology PDF"
+    with stage("embed"):
+        q_embedding = embed_question(question, model)
+    top_chunks = hybrid_search(question, q_embedding, index, chunks, bm25, top_k=5, threshold=0.8)
+    return q_embedding, top_chunks
 
+def log_exchange(question, answer, source):
     logging.info(f"Question: {question}")
     logging.info(f"Answer: {answer}")
     logging.info(f"Source: {source}")
 
-    followup_prompt = "\n\nHow else can I assist you today?"
-    return answer + followup_prompt, source
+def cached_answer(q_embedding, top_chunks, trace):
+    cache = get_answer_cache()
+    with trace.stage("answer_cache"):
+        answer = cache.get(q_embedding, top_chunks)
+    trace.cache_result("answer", answer is not None)
+    if answer is not None:
+        logging.info(f"Answer cache hit ({cache.stats()})")
+    return cache, answer
+
+def prompt_context(top_chunks, report, trace):
+    # deduped chunks packed into the token budget, plus the patient's discharge summary
+    with trace.stage("context"):
+        context = build_context(top_chunks, report)
+    trace.annotate(context_tokens=context.tokens, chunks_packed=len(context.chunks), chunks_dropped=context.dropped)
+    return context
+
+def run_clinical_agent(question, report=None):
+    if question.strip().lower() in EXIT_WORDS:
+        return (FAREWELL, "Session Ended")
+
+    trace = Trace("clinical")
+    with trace.activate():
+        q_embedding, top_chunks = retrieve(question)
+        trace.annotate(chunks=len(top_chunks))
+
+        if not top_chunks:
+            logging.warning(f"No relevant chunks found for: {question}")
+            answer = fallback_web_search(question, q_embedding)
+            source = WEB_SOURCE
+        else:
+            context = prompt_context(top_chunks, report, trace)
+            cache, answer = cached_answer(q_embedding, context.grounding, trace)
+            source = PDF_SOURCE
+            if answer is None:
+                try:
+                    with trace.stage("llm"):
+                        answer = clean_answer(generate_answer(context.text, question, context.patient))
+                    cache.put(q_embedding, context.grounding, answer, question)
+                except LLMError as e:
+                    logging.error(f"LLM unavailable, using web fallback: {e}")
+                    trace.annotate(llm_error=str(e))
+                    answer = fallback_web_search(question, q_embedding)
+                    source = WEB_SOURCE
+
+    log_exchange(question, answer, source)
+    trace.finish(source=source)
+    return answer + FOLLOWUP_PROMPT, source
+
+class ClinicalStream:
+    # Iterable of answer pieces; .source is final once iteration finishes
+    def __init__(self, source, pieces=(), trace=None):
+        self.source = source
+        self.text = ""
+        self._pieces = pieces
+        self.trace = trace
+
+    def __iter__(self):
+        for piece in self._pieces:
+            self.text += piece
+            yield piece
+        if self.trace is not None:
+            self.trace.finish(source=self.source)
+
+def stream_clinical_agent(question, report=None):
+    # Streaming twin of run_clinical_agent: pieces reach the UI as the LLM writes them
+    if question.strip().lower() in EXIT_WORDS:
+        return ClinicalStream("Session Ended", [FAREWELL])
+
+    # the trace is finished by ClinicalStream once the last piece has been consumed
+    trace = Trace("clinical_stream")
+    with trace.activate():
+        q_embedding, top_chunks = retrieve(question)
+        trace.annotate(chunks=len(top_chunks))
+        if not top_chunks:
+            logging.warning(f"No relevant chunks found for: {question}")
+            answer = fallback_web_search(question, q_embedding)
+            log_exchange(question, answer, WEB_SOURCE)
+            return ClinicalStream(WEB_SOURCE, [answer, FOLLOWUP_PROMPT], trace)
+
+        context = prompt_context(top_chunks, report, trace)
+        cache, cached = cached_answer(q_embedding, context.grounding, trace)
+    if cached is not None:
+        log_exchange(question, cached, PDF_SOURCE)
+        return ClinicalStream(PDF_SOURCE, [cached, FOLLOWUP_PROMPT], trace)
+
+    stream = ClinicalStream(PDF_SOURCE, trace=trace)
+
+    def generate():
+        # runs wherever the caller iterates (Streamlit, a service thread), so the trace is used
+        # directly rather than through the context variable
+        answer = ""
+        start = time.perf_counter()
+        try:
+            for piece in stream_answer(context.text, question, context.patient):
+                if not answer:
+                    trace.annotate(llm_first_piece_ms=round((time.perf_counter() - start) * 1000, 3))
+                answer += piece
+                yield piece
+            trace.add("llm", (time.perf_counter() - start) * 1000)
+            cache.put(q_embedding, context.grounding, answer, question)
+        except LLMError as e:
+            trace.add("llm", (time.perf_counter() - start) * 1000)
+            trace.annotate(llm_error=str(e))
+            if answer:
+                # part of the answer is already on screen; say so rather than swapping sources
+                logging.error(f"LLM stream interrupted: {e}")
+                notice = "\n\n⚠️ The answer was interrupted. Please ask again."
+                answer += notice
+                yield notice
+            else:
+                logging.error(f"LLM unavailable, using web fallback: {e}")
+                with trace.activate():
+                    answer = fallback_web_search(question, q_embedding)
+                stream.source = WEB_SOURCE
+                yield answer
+        log_exchange(question, answer, stream.source)
+        yield FOLLOWUP_PROMPT
+
+    stream._pieces = generate()
+    return stream
 
 if __name__ == "__main__":
+    from service_client import get_service_client
+    service = get_service_client()    # MEDAI_SERVICE_URL set: ask the shared service instead of loading models
+    if service is None:
+        get_registry().warm_up()
     print("💬 Clinical Agent Activated!")
     while True:
         user_question = input("👤 Ask your medical question: ")
-        answer, src = run_clinical_agent(user_question)
+        answer, src = service.ask(user_question) if service else run_clinical_agent(user_question)
         print("\n🤖 Clinical Agent:", answer)
         print(src)
         if src == "Session Ended":
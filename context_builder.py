@@ -0,0 +1,88 @@
+import os
+import re
+
+from retrieval import dedupe_chunks
+
+CONTEXT_TOKEN_BUDGET = int(os.environ.get("MEDAI_CONTEXT_TOKENS", "1200"))    # retrieved chunks + patient summary
+
+_PIECE = re.compile(r"\w+|[^\w\s]", re.UNICODE)
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+
+
+def estimate_tokens(text):
+    # Close to subword tokenizer counts for English: one token per word or punctuation mark,
+    # plus one more for every 8 characters of a long word. No tokenizer model needed.
+    return sum(1 + len(piece) // 8 for piece in _PIECE.findall(text))
+
+
+def _joined(value):
+    return "; ".join(value) if isinstance(value, list) else value
+
+
+def patient_summary(report):
+    # the parts of the discharge report a clinical answer should respect, a few lines long
+    if not report:
+        return ""
+    fields = [("Diagnosis", "primary_diagnosis"), ("Medications", "medications"),
+              ("Diet", "dietary_restrictions"), ("Warning signs", "warning_signs")]
+    return "\n".join(f"{label}: {_joined(report[key])}" for label, key in fields if report.get(key))
+
+
+def truncate_to_budget(text, budget):
+    # whole sentences while they fit; a single oversized sentence is cut at a word, and a single
+    # oversized word is cut in characters, so a non-empty text never comes back empty
+    kept, used = [], 0
+    for sentence in _SENTENCE_END.split(text):
+        cost = estimate_tokens(sentence)
+        if used + cost > budget:
+            if not kept:
+                words = sentence.split()
+                while len(words) > 1 and estimate_tokens(" ".join(words)) > budget:
+                    words = words[:max(1, min(len(words) * budget // max(cost, 1), len(words) - 1))]
+                cut = " ".join(words)
+                while len(cut) > 1 and estimate_tokens(cut) > budget:
+                    cut = cut[:max(1, min(len(cut) * budget // estimate_tokens(cut), len(cut) - 1))]
+                kept.append(cut)
+            break
+        kept.append(sentence)
+        used += cost
+    return " ".join(kept)
+
+
+class PromptContext:
+    # What goes into one prompt: the patient summary and the chunks that fit the budget
+    def __init__(self, patient, chunks, tokens, dropped):
+        self.patient = patient
+        self.chunks = chunks
+        self.tokens = tokens
+        self.dropped = dropped
+
+    @property
+    def text(self):
+        return "\n\n".join(self.chunks)
+
+    @property
+    def grounding(self):
+        # everything the answer depends on besides the question, for keying the answer cache
+        return [self.patient, *self.chunks] if self.patient else list(self.chunks)
+
+
+def build_context(chunks, report=None, budget=CONTEXT_TOKEN_BUDGET):
+    # chunks arrive best first (hybrid_search order); overlaps are merged, then the best ones
+    # are packed greedily, skipping any that would overflow while smaller ones may still fit
+    patient = patient_summary(report)
+    used = estimate_tokens(patient)
+    packed, dropped = [], 0
+    for chunk in dedupe_chunks(list(chunks)):
+        cost = estimate_tokens(chunk)
+        if used + cost <= budget:
+            packed.append(chunk)
+            used += cost
+        elif not packed and budget - used > 0:
+            # never send an empty context just because the best chunk is long
+            chunk = truncate_to_budget(chunk, budget - used)
+            packed.append(chunk)
+            used += estimate_tokens(chunk)
+        else:
+            dropped += 1
+    return PromptContext(patient, packed, used, dropped)
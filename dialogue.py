@@ -0,0 +1,206 @@
+from enum import IntEnum
+from functools import lru_cache
+
+from patient_lookup import find_patient_by_name
+
+GREETING_MSG = "Hello! I'm your AI care assistant. What's your name?"
+FORWARD_MSG = "Forwarding to Clinical Agent for medical assistance..."
+CLOSING_MSG = "Thanks for your answers. Let me know any medical issues you're facing."
+HANDBACK_MSG = "I hope I was able to answer all your medical queries. Transferring you back to the receptionist for any final checkups."
+WRAP_MSG = "Is there anything else I can assist you with?"
+FINAL_MSG = "You may still ask questions or type 'bye' to end the session."
+GOODBYE_MSG = "Thank you for using MedAI Assistant. Wishing you good health and a speedy recovery! 👋"
+MULTIPLE_MSG = "Multiple matches found. Please enter full name with more detail."
+
+CLINICAL_EXIT_WORDS = frozenset(["bye", "exit", "thank you", "thanks"])
+SESSION_EXIT_WORDS = frozenset(["bye", "exit", "goodbye"])
+
+
+class DialogueState(IntEnum):
+    AWAITING_NAME = 0
+    ASKING_QUESTIONS = 1
+    CLINICAL = 2
+    FOLLOWUP = 3
+    CHATTING = 4
+    DONE = 5
+
+
+def _joined(value):
+    return ", ".join(value) if isinstance(value, list) else value
+
+
+@lru_cache(maxsize=4096)
+def _questions(medications, dietary_restrictions, warning_signs, follow_up):
+    return (
+        f"Are you taking your medications as prescribed: {medications}?",
+        f"Are you following your dietary restrictions: {dietary_restrictions}?",
+        f"Have you noticed any warning signs like {warning_signs}?",
+        f"Have you scheduled your follow-up: {follow_up}?",
+    )
+
+
+def get_questions(report):
+    # follow-up questions for a discharge report; reports sharing a care plan share one tuple
+    return _questions(_joined(report["medications"]), _joined(report["dietary_restrictions"]),
+                      _joined(report["warning_signs"]), _joined(report["follow_up"]))
+
+
+class Session:
+    # One patient's conversation. Answered questions are a bitmask, so the "next unanswered
+    # question" is a couple of integer ops and a snapshot is a handful of scalars plus the report.
+    __slots__ = ("state", "name", "report", "q_index", "answered", "questions")
+
+    def __init__(self, state=DialogueState.AWAITING_NAME, name="", report=None, q_index=0, answered=0):
+        self.state = DialogueState(state)
+        self.name = name
+        self.report = report
+        self.q_index = q_index
+        self.answered = answered
+        self.questions = get_questions(report) if report else ()
+
+    def snapshot(self):
+        return {"s": int(self.state), "n": self.name, "r": self.report, "q": self.q_index, "a": self.answered}
+
+    @classmethod
+    def restore(cls, data):
+        if not data:
+            return cls()
+        return cls(data["s"], data["n"], data["r"], data["q"], data["a"])
+
+    def mark_answered(self, i):
+        self.answered |= 1 << i
+
+    def is_answered(self, i):
+        return bool(self.answered >> i & 1)
+
+    def next_unanswered(self, start=0):
+        # lowest unanswered question index >= start, or None
+        pending = ~self.answered & ((1 << len(self.questions)) - 1) & ~((1 << start) - 1)
+        return (pending & -pending).bit_length() - 1 if pending else None
+
+
+class Turn:
+    # What a front-end should show for one user message: receptionist/clinical messages in
+    # order, then (if set) the clinical agent's answer to clinical_question.
+    __slots__ = ("messages", "clinical_question")
+
+    def __init__(self):
+        self.messages = []
+        self.clinical_question = None
+
+    def say(self, role, text):
+        self.messages.append((role, text))
+
+
+def patient_lookup(service=None, patients=None):
+    # lookup(name) for DialogueEngine, against service.py or an in-process PatientIndex
+    def lookup(name):
+        if service:
+            result = service.lookup(name)
+            if result["status"] == "found":
+                return result["report"], []
+            if result["status"] == "multiple":
+                return result["matches"], []
+            return result["message"], result["suggestions"]
+        result = find_patient_by_name(name, patients)
+        return result, patients.fuzzy_search(name) if isinstance(result, str) else []
+    return lookup
+
+
+class DialogueEngine:
+    # The receptionist/clinical hand-off flow shared by main_app, the receptionist CLI and service.py.
+    # lookup(name) -> (record / list / not-found message, suggested names)
+    def __init__(self, lookup, is_medical):
+        self.lookup = lookup
+        self.is_medical = is_medical
+
+    def step(self, session, text):
+        turn = Turn()
+        handler = _HANDLERS.get(session.state)
+        if handler is not None:
+            handler(self, session, text, turn)
+        return turn
+
+    def _awaiting_name(self, session, text, turn):
+        result, suggestions = self.lookup(text)
+        if isinstance(result, str):
+            msg = result
+            if suggestions:
+                msg += " Did you mean: " + ", ".join(s.title() for s in suggestions) + "?"
+            turn.say("receptionist", msg)
+        elif isinstance(result, list):
+            turn.say("receptionist", MULTIPLE_MSG)
+        else:
+            session.name = result["patient_name"]
+            session.report = result
+            session.questions = get_questions(result)
+            session.state = DialogueState.ASKING_QUESTIONS
+            question = session.questions[session.q_index]
+            turn.say("receptionist", f"Hello **{result['patient_name']}**! Your diagnosis is **{result['primary_diagnosis']}**.\n\n{question}")
+
+    def _forward(self, session, text, turn):
+        session.state = DialogueState.CLINICAL
+        turn.say("receptionist", FORWARD_MSG)
+        turn.clinical_question = text
+
+    def _asking_questions(self, session, text, turn):
+        if self.is_medical(text):
+            self._forward(session, text, turn)
+            return
+        session.mark_answered(session.q_index)
+        session.q_index += 1
+        if session.q_index < len(session.questions):
+            turn.say("receptionist", session.questions[session.q_index])
+        else:
+            session.state = DialogueState.CLINICAL
+            turn.say("receptionist", CLOSING_MSG)
+
+    def _ask_next(self, session, start, turn):
+        i = session.next_unanswered(start)
+        if i is None:
+            return False
+        session.q_index = i
+        turn.say("receptionist", session.questions[i])
+        return True
+
+    def _clinical(self, session, text, turn):
+        if text.strip().lower() not in CLINICAL_EXIT_WORDS:
+            self._forward(session, text, turn)
+            return
+        turn.say("clinical", HANDBACK_MSG)
+        session.state = DialogueState.FOLLOWUP
+        session.q_index = 0
+        if not self._ask_next(session, 0, turn):
+            session.state = DialogueState.CHATTING
+            turn.say("receptionist", WRAP_MSG)
+
+    def _followup(self, session, text, turn):
+        if session.q_index >= len(session.questions):
+            return
+        session.mark_answered(session.q_index)
+        session.q_index += 1
+        if not self._ask_next(session, session.q_index, turn):
+            session.state = DialogueState.CHATTING
+            turn.say("receptionist", WRAP_MSG)
+
+    def _chatting(self, session, text, turn):
+        if text.strip().lower() in SESSION_EXIT_WORDS:
+            turn.say("receptionist", GOODBYE_MSG)
+            session.state = DialogueState.DONE
+        elif self.is_medical(text):
+            self._forward(session, text, turn)
+        elif session.q_index < len(session.questions):
+            session.mark_answered(session.q_index)
+            session.q_index += 1
+            self._ask_next(session, session.q_index, turn)
+        else:
+            turn.say("receptionist", FINAL_MSG)
+
+
+_HANDLERS = {
+    DialogueState.AWAITING_NAME: DialogueEngine._awaiting_name,
+    DialogueState.ASKING_QUESTIONS: DialogueEngine._asking_questions,
+    DialogueState.CLINICAL: DialogueEngine._clinical,
+    DialogueState.FOLLOWUP: DialogueEngine._followup,
+    DialogueState.CHATTING: DialogueEngine._chatting,
+}
@@ -0,0 +1,217 @@
+import argparse
+import os
+import re
+import sqlite3
+import threading
+import time
+import zlib
+from collections import OrderedDict
+import numpy as np
+from metrics import cache_result
+
+EMBEDDING_MODEL_NAME = "all-MiniLM-L6-v2"
+EMBED_BACKEND = os.environ.get("MEDAI_EMBED_BACKEND", "torch")    # torch | onnx | onnx-int8 | hash (offline)
+EMBED_THREADS = int(os.environ.get("MEDAI_EMBED_THREADS", "0"))    # 0 = library default
+ONNX_DIR = "model/minilm-onnx"
+QUERY_CACHE_PATH = "embeddings/query_embeddings.sqlite"
+QUERY_CACHE_SIZE = 4096
+COSINE_TOLERANCE = 0.99    # minimum cosine to the PyTorch reference for a backend to be accepted
+
+
+class TorchEmbedder:
+    name = "torch"
+
+    def __init__(self, model_name=EMBEDDING_MODEL_NAME, threads=EMBED_THREADS):
+        import torch
+        from sentence_transformers import SentenceTransformer
+        if threads:
+            torch.set_num_threads(threads)
+        self.model = SentenceTransformer(model_name, device="cpu")
+
+    def encode(self, texts, batch_size=32, **kwargs):
+        return np.asarray(self.model.encode(list(texts), batch_size=batch_size, **kwargs), dtype="float32")
+
+
+class OnnxEmbedder:
+    # Same pipeline as all-MiniLM-L6-v2 (mean pooling + L2 normalize) on ONNX Runtime
+    def __init__(self, model_dir=ONNX_DIR, quantized=False, threads=EMBED_THREADS, max_length=256):
+        import onnxruntime as ort
+        from transformers import AutoTokenizer
+        self.name = "onnx-int8" if quantized else "onnx"
+        options = ort.SessionOptions()
+        if threads:
+            options.intra_op_num_threads = threads
+            options.inter_op_num_threads = 1
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        model_file = "model.int8.onnx" if quantized else "model.onnx"
+        self.session = ort.InferenceSession(os.path.join(model_dir, model_file), options, providers=["CPUExecutionProvider"])
+        self.tokenizer = AutoTokenizer.from_pretrained(model_dir)
+        self.input_names = {i.name for i in self.session.get_inputs()}
+        self.max_length = max_length
+
+    def encode(self, texts, batch_size=32, **kwargs):
+        texts = list(texts)
+        out = []
+        for start in range(0, len(texts), batch_size):
+            batch = self.tokenizer(texts[start:start + batch_size], padding=True, truncation=True,
+                                   max_length=self.max_length, return_tensors="np")
+            feeds = {k: v.astype("int64") for k, v in batch.items() if k in self.input_names}
+            hidden = self.session.run(None, feeds)[0]
+            mask = batch["attention_mask"][..., None].astype("float32")
+            pooled = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+            out.append(pooled / np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None))
+        if not out:
+            return np.zeros((0, 384), dtype="float32")
+        return np.vstack(out).astype("float32")
+
+
+class HashEmbedder:
+    # Feature-hashed bag of words, L2-normalized. No model download, deterministic across runs:
+    # for offline benchmarks and smoke tests, not for answering patients.
+    name = "hash"
+
+    def __init__(self, dimension=384):
+        self.dimension = dimension
+
+    def encode(self, texts, batch_size=32, **kwargs):
+        texts = list(texts)
+        out = np.zeros((len(texts), self.dimension), dtype="float32")
+        for row, text in enumerate(texts):
+            for token in re.findall(r"\w+", text.casefold()):
+                out[row, zlib.crc32(token.encode("utf-8")) % self.dimension] += 1.0
+        return out / np.clip(np.linalg.norm(out, axis=1, keepdims=True), 1e-12, None)
+
+
+def export_onnx(model_name=EMBEDDING_MODEL_NAME, out_dir=ONNX_DIR):
+    # Exports the transformer to model.onnx and a dynamically int8-quantized model.int8.onnx
+    import torch
+    from sentence_transformers import SentenceTransformer
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    st_model = SentenceTransformer(model_name, device="cpu")
+    transformer = st_model[0].auto_model.eval()
+    tokenizer = st_model.tokenizer
+    os.makedirs(out_dir, exist_ok=True)
+    tokenizer.save_pretrained(out_dir)
+
+    sample = tokenizer(["export sample"], return_tensors="pt")
+    names = ["input_ids", "attention_mask", "token_type_ids"]
+    axes = {name: {0: "batch", 1: "sequence"} for name in names}
+    axes["last_hidden_state"] = {0: "batch", 1: "sequence"}
+    with torch.no_grad():
+        torch.onnx.export(transformer, tuple(sample[n] for n in names), os.path.join(out_dir, "model.onnx"),
+                          input_names=names, output_names=["last_hidden_state"], dynamic_axes=axes, opset_version=14)
+    quantize_dynamic(os.path.join(out_dir, "model.onnx"), os.path.join(out_dir, "model.int8.onnx"), weight_type=QuantType.QInt8)
+    return out_dir
+
+
+def make_embedder(name=EMBED_BACKEND, threads=EMBED_THREADS):
+    if name == "torch":
+        return TorchEmbedder(threads=threads)
+    if name in ("onnx", "onnx-int8"):
+        return OnnxEmbedder(quantized=name == "onnx-int8", threads=threads)
+    if name == "hash":
+        return HashEmbedder()
+    raise ValueError(f"Unknown embedding backend {name!r}, expected torch, onnx, onnx-int8 or hash")
+
+
+def validate_embedder(candidate, reference, texts, tolerance=COSINE_TOLERANCE):
+    # cosine between candidate and reference vectors for the same texts, plus encode latency
+    start = time.perf_counter()
+    got = candidate.encode(texts)
+    candidate_ms = (time.perf_counter() - start) * 1000 / len(texts)
+    start = time.perf_counter()
+    expected = reference.encode(texts)
+    reference_ms = (time.perf_counter() - start) * 1000 / len(texts)
+    cos = np.sum(got * expected, axis=1) / (np.linalg.norm(got, axis=1) * np.linalg.norm(expected, axis=1))
+    return {"backend": candidate.name, "min_cosine": float(cos.min()), "mean_cosine": float(cos.mean()),
+            "ok": bool(cos.min() >= tolerance), "ms_per_text": candidate_ms, "reference_ms_per_text": reference_ms}
+
+
+def normalize_query(text):
+    # MiniLM's tokenizer is uncased, so casefolding and whitespace collapsing don't change the vector
+    return re.sub(r"\s+", " ", text.casefold()).strip()
+
+
+class CachedQueryEncoder:
+    # LRU in memory, SQLite on disk, keyed by backend + normalized text. Only misses reach the model,
+    # in one batched encode call.
+    def __init__(self, embedder, path=QUERY_CACHE_PATH, max_entries=QUERY_CACHE_SIZE):
+        self.embedder = embedder
+        self.name = embedder.name
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lru = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        if path:
+            if path != ":memory:":
+                os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute("CREATE TABLE IF NOT EXISTS query_embeddings (backend TEXT, text TEXT, embedding BLOB, PRIMARY KEY (backend, text))")
+            self._db.commit()
+
+    def _get(self, key):
+        if key in self._lru:
+            self._lru.move_to_end(key)
+            return self._lru[key]
+        if self._db is not None:
+            row = self._db.execute("SELECT embedding FROM query_embeddings WHERE backend = ? AND text = ?", (self.name, key)).fetchone()
+            if row:
+                vector = np.frombuffer(row[0], dtype="float32")
+                self._remember(key, vector)
+                return vector
+        return None
+
+    def _remember(self, key, vector):
+        self._lru[key] = vector
+        self._lru.move_to_end(key)
+        while len(self._lru) > self.max_entries:
+            self._lru.popitem(last=False)
+
+    def encode(self, texts, batch_size=32, **kwargs):
+        keys = [normalize_query(t) for t in texts]
+        vectors = [None] * len(keys)
+        with self._lock:
+            for i, key in enumerate(keys):
+                vectors[i] = self._get(key)
+        missing = sorted({key for key, v in zip(keys, vectors) if v is None})
+        self.hits += len(keys) - sum(v is None for v in vectors)
+        self.misses += sum(v is None for v in vectors)
+        cache_result("query_embedding", not missing)
+
+        if missing:
+            fresh = dict(zip(missing, np.asarray(self.embedder.encode(missing, batch_size=batch_size), dtype="float32")))
+            with self._lock:
+                for key, vector in fresh.items():
+                    self._remember(key, vector)
+                if self._db is not None:
+                    self._db.executemany("INSERT OR REPLACE INTO query_embeddings VALUES (?, ?, ?)",
+                                         [(self.name, key, vector.tobytes()) for key, vector in fresh.items()])
+                    self._db.commit()
+            vectors = [fresh[key] if v is None else v for key, v in zip(keys, vectors)]
+        if not vectors:
+            return np.zeros((0, 384), dtype="float32")
+        return np.vstack(vectors)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export and validate CPU embedding backends")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("export", help=f"export ONNX + int8 models to {ONNX_DIR}")
+    validate = sub.add_parser("validate", help="compare a backend against the PyTorch reference")
+    validate.add_argument("--backend", default="onnx-int8", choices=["onnx", "onnx-int8"])
+    validate.add_argument("--threads", type=int, default=EMBED_THREADS)
+    args = parser.parse_args()
+
+    if args.command == "export":
+        print(f"✅ Exported to {export_onnx()}")
+    else:
+        samples = ["why are my legs swollen?", "Can I take ibuprofen with my kidney disease?",
+                   "What is a normal GFR?", "Foamy urine and fatigue after discharge",
+                   "How much salt can I eat per day on a low sodium diet?"] * 4
+        report = validate_embedder(make_embedder(args.backend, args.threads), TorchEmbedder(threads=args.threads), samples)
+        print(report)
+        if not report["ok"]:
+            raise SystemExit(f"❌ {args.backend} deviates beyond cosine {COSINE_TOLERANCE}")
@@ -1,9 +1,9 @@
 from faker import Faker   # will generate fake names and date
+from datetime import date, timedelta
+import argparse
 import random
 import json
 
-fake = Faker()
-
 diagnoses = [
     "Diabetic Nephropathy",
     "Hypertensive Nephrosclerosis",
@@ -34,30 +34,53 @@ warning_signs = [
     "Foamy urine, persistent fatigue"
 ]
 
+NAME_POOL_SIZE = 2000    # distinct first and last names drawn from Faker, combined per patient
+
+
+def name_pools(seed, size=NAME_POOL_SIZE):
+    # Faker is slow per call, so it only fills the pools; millions of patients reuse them
+    fake = Faker()
+    fake.seed_instance(seed)
+    return [fake.first_name() for _ in range(size)], [fake.last_name() for _ in range(size)]
+
+
+def iter_patients(n, seed=0, base_date=None):
+    # Same report shape as always; a given (n, seed, base_date) always yields the same roster
+    rng = random.Random(seed)
+    first_names, last_names = name_pools(seed)
+    base_date = base_date or date.today()
+    for _ in range(n):
+        yield {
+            "patient_name": f"{rng.choice(first_names)} {rng.choice(last_names)}",
+            "discharge_date": (base_date - timedelta(days=rng.randrange(181))).strftime('%Y-%m-%d'),
+            "primary_diagnosis": rng.choice(diagnoses),
+            "medications": rng.choice(medications),
+            "dietary_restrictions": rng.choices(diet_restrictions),
+            "follow_up": rng.choices(follow_ups),
+            "warning_signs": rng.choice(warning_signs),
+            "discharge_instructions": "Monitor blood pressure daily and record body weight every morning."
+        }
+
+
+def write_roster(path, n, seed=0, base_date=None):
+    # streams to disk: .jsonl for patient_store.PatientStore, anything else as the legacy JSON array
+    with open(path, "w", encoding="utf-8") as f:
+        if path.endswith(".jsonl"):
+            for patient in iter_patients(n, seed, base_date):
+                f.write(json.dumps(patient) + "\n")
+        else:
+            f.write("[\n")
+            for i, patient in enumerate(iter_patients(n, seed, base_date)):
+                f.write((",\n" if i else "") + json.dumps(patient, indent=2))
+            f.write("\n]")
+    return n
+
 
-patients = []
-
-for i in range(25):
-    name = fake.name()
-    date = fake.date_between(start_date='-180d', end_date='today').strftime('%Y-%m-%d')
-    diagnosis = random.choice(diagnoses)
-    meds = random.choice(medications)
-    diet = random.choices(diet_restrictions)
-    follow = random.choices(follow_ups)
-    warning = random.choice(warning_signs)
-
-    patient_report = {
-        "patient_name":name,
-        "discharge_date": date,
-        "primary_diagnosis": diagnosis,
-        "medications": meds,
-        "dietary_restrictions": diet,
-        "follow_up": follow,
-        "warning_signs": warning,
-        "discharge_instructions": "Monitor blood pressure daily and record body weight every morning."
-    }
-
-    patients.append(patient_report)
-
-with open("patient_reports.json", "w") as f:
-    json.dump(patients, f, indent=2)
\ No newline at end of file
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate dummy discharge reports")
+    parser.add_argument("-n", type=int, default=25, help="number of patients")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", default="patient_reports.json", help=".json array or .jsonl store")
+    args = parser.parse_args()
+    write_roster(args.out, args.n, args.seed)
+    print(f"Wrote {args.n} patients to {args.out}")
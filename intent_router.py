@@ -0,0 +1,109 @@
+import os
+import re
+import threading
+import numpy as np
+
+ROUTER_MODE = os.environ.get("MEDAI_ROUTER", "keyword")    # keyword | embedding
+ROUTER_MARGIN = float(os.environ.get("MEDAI_ROUTER_MARGIN", "0.05"))
+
+# Medical terms from the lists the Streamlit app and the receptionist CLI used to scan separately.
+# Matching is whole-word, so forms the old substring scan caught implicitly are listed explicitly.
+MEDICAL_KEYWORDS = [
+    "pain", "painful", "painkiller", "swelling", "swollen", "urine", "urinate", "urinating",
+    "blood", "bloody", "bleeding", "symptom", "dizzy", "dizziness", "nausea", "nauseous", "vomiting", "vomit",
+    "gfr", "kidney", "dialysis", "drug", "nephrology", "medicine", "medication", "side effect",
+]
+
+# Example phrasings for the embedding classifier; a message goes clinical when it sits closer to
+# the medical centroid than to the small-talk one by at least ROUTER_MARGIN
+MEDICAL_EXAMPLES = [
+    "My legs are swollen since I got home", "I feel short of breath at night",
+    "Can I take ibuprofen with my kidney problem?", "What does a high creatinine mean?",
+    "My urine looks foamy", "I have been feeling very tired and weak",
+    "Is it normal to have a headache after dialysis?", "What foods should I avoid with CKD?",
+    "I missed a dose of my blood pressure pill", "I have a fever and chills",
+]
+SMALL_TALK_EXAMPLES = [
+    "Yes", "No", "Yes I am", "I'm fine, thanks", "Everything is going well",
+    "I have scheduled it already", "Not yet, I will do it tomorrow", "Okay sounds good",
+    "Can you say that again?", "Who are you?",
+]
+
+
+def compile_keywords(keywords):
+    # one alternation, longest first, whole words only (so "ai" no longer fires inside "again")
+    words = sorted({k.lower() for k in keywords}, key=len, reverse=True)
+    alternation = "|".join(re.escape(w).replace(r"\ ", r"\s+") for w in words)
+    return re.compile(rf"\b(?:{alternation})(?:s|es)?\b", re.IGNORECASE)
+
+
+MEDICAL_PATTERN = compile_keywords(MEDICAL_KEYWORDS)
+
+
+class EmbeddingIntentClassifier:
+    # Nearest-centroid over MiniLM vectors. Goes through the registry's cached query encoder,
+    # so a message routed to the clinical agent is not embedded a second time for retrieval.
+    def __init__(self, encoder, medical=MEDICAL_EXAMPLES, other=SMALL_TALK_EXAMPLES, margin=ROUTER_MARGIN):
+        self.encoder = encoder
+        self.margin = margin
+        self.centroids = np.vstack([self._centroid(medical), self._centroid(other)])
+
+    def _centroid(self, texts):
+        vectors = np.asarray(self.encoder.encode(texts), dtype="float32")
+        vectors /= np.clip(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12, None)
+        c = vectors.mean(axis=0)
+        return c / max(np.linalg.norm(c), 1e-12)
+
+    def score(self, text):
+        v = np.asarray(self.encoder.encode([text]), dtype="float32")[0]
+        v /= max(np.linalg.norm(v), 1e-12)
+        medical, other = self.centroids @ v
+        return float(medical - other)
+
+    def is_medical(self, text):
+        return self.score(text) >= self.margin
+
+
+class IntentRouter:
+    # Keyword regex first (microseconds); the optional classifier only sees messages it didn't match
+    def __init__(self, pattern=MEDICAL_PATTERN, classifier=None):
+        self.pattern = pattern
+        self.classifier = classifier
+
+    def is_medical(self, text):
+        if self.pattern.search(text):
+            return True
+        if self.classifier is not None and text.strip():
+            return self.classifier.is_medical(text)
+        return False
+
+
+router = None
+_lock = threading.Lock()
+
+
+def make_router(mode=ROUTER_MODE):
+    if mode == "keyword":
+        return IntentRouter()
+    if mode == "embedding":
+        from model_registry import get_registry
+        return IntentRouter(classifier=EmbeddingIntentClassifier(get_registry().get_query_encoder()))
+    raise ValueError(f"Unknown router mode {mode!r}, expected keyword or embedding")
+
+
+def get_router():
+    global router
+    if router is None:
+        with _lock:
+            if router is None:
+                router = make_router()
+    return router
+
+
+def set_router(new_router):
+    global router
+    router = new_router
+
+
+def is_medical_query(text):
+    return get_router().is_medical(text)
@@ -0,0 +1,227 @@
+import asyncio
+import hashlib
+import logging
+import os
+import queue
+import random
+import threading
+
+GEMINI_MODEL_NAME = "gemini-2.5-flash"
+DEFAULT_BACKEND = os.environ.get("MEDAI_LLM_BACKEND", "gemini")    # gemini | llama | stub
+MAX_CONCURRENCY = int(os.environ.get("MEDAI_LLM_CONCURRENCY", "4"))
+REQUEST_TIMEOUT = float(os.environ.get("MEDAI_LLM_TIMEOUT", "30"))
+MAX_RETRIES = 2
+
+
+class LLMError(RuntimeError):
+    pass
+
+
+_STREAM_END = object()
+
+
+class GeminiBackend:
+    name = "gemini"
+
+    def __init__(self, model_name=GEMINI_MODEL_NAME, api_key=None):
+        import google.generativeai as genai
+        genai.configure(api_key=api_key or os.environ.get("GEMINI_API_KEY", ""))
+        self.model = genai.GenerativeModel(model_name)
+
+    async def generate(self, prompt):
+        response = await self.model.generate_content_async(prompt)
+        return response.text
+
+    async def stream(self, prompt):
+        response = await self.model.generate_content_async(prompt, stream=True)
+        async for chunk in response:
+            if chunk.text:
+                yield chunk.text
+
+
+class LlamaCppBackend:
+    # Local GGUF model (e.g. Mistral) through llama-cpp; one generation at a time per model
+    name = "llama"
+
+    def __init__(self, model_path=None, n_ctx=4096, max_tokens=512):
+        from llama_cpp import Llama
+        model_path = model_path or os.environ.get("LLAMA_MODEL_PATH", "model/mistral-7b-instruct.Q4_K_M.gguf")
+        self.llm = Llama(model_path=model_path, n_ctx=n_ctx, verbose=False)
+        self.max_tokens = max_tokens
+        self._lock = threading.Lock()
+
+    def _complete(self, prompt):
+        with self._lock:
+            out = self.llm(prompt, max_tokens=self.max_tokens)
+        return out["choices"][0]["text"]
+
+    async def generate(self, prompt):
+        return await asyncio.to_thread(self._complete, prompt)
+
+    def _stream_tokens(self, prompt, loop, tokens):
+        try:
+            with self._lock:
+                for out in self.llm(prompt, max_tokens=self.max_tokens, stream=True):
+                    loop.call_soon_threadsafe(tokens.put_nowait, out["choices"][0]["text"])
+        finally:
+            loop.call_soon_threadsafe(tokens.put_nowait, _STREAM_END)
+
+    async def stream(self, prompt):
+        # llama-cpp yields tokens synchronously, so a worker thread feeds them to the loop
+        tokens = asyncio.Queue()
+        worker = asyncio.ensure_future(asyncio.to_thread(self._stream_tokens, prompt, asyncio.get_running_loop(), tokens))
+        while (token := await tokens.get()) is not _STREAM_END:
+            yield token
+        await worker
+
+
+class StubBackend:
+    # Deterministic offline backend for tests and load runs: same prompt, same answer
+    name = "stub"
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.calls = 0
+
+    def _answer(self, prompt):
+        question = prompt.rsplit("Question:", 1)[-1].split("Answer:", 1)[0].strip()
+        digest = hashlib.sha1(prompt.encode("utf-8")).hexdigest()[:8]
+        return f"[stub {digest}] Based on your discharge information, regarding \"{question}\": please follow your care plan and contact your nephrologist if symptoms persist."
+
+    async def generate(self, prompt):
+        self.calls += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return self._answer(prompt)
+
+    async def stream(self, prompt):
+        self.calls += 1
+        words = self._answer(prompt).split(" ")
+        for i, word in enumerate(words):
+            if self.latency:
+                await asyncio.sleep(self.latency / len(words))
+            yield word if i == 0 else " " + word
+
+
+BACKENDS = {"gemini": GeminiBackend, "llama": LlamaCppBackend, "stub": StubBackend}
+
+
+class LLMClient:
+    # Runs every request on one background event loop, so Streamlit threads, CLIs and
+    # async servers share the same concurrency limit and in-flight request table.
+    def __init__(self, backend, max_concurrency=MAX_CONCURRENCY, timeout=REQUEST_TIMEOUT,
+                 retries=MAX_RETRIES, backoff=0.5):
+        self.backend = backend
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self._inflight = {}
+        self._loop = asyncio.new_event_loop()
+        self._semaphore = None
+        self._ready = threading.Event()
+        threading.Thread(target=self._run_loop, args=(max_concurrency,), name="llm-client", daemon=True).start()
+        self._ready.wait()
+
+    def _run_loop(self, max_concurrency):
+        asyncio.set_event_loop(self._loop)
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._ready.set()
+        self._loop.run_forever()
+
+    async def _call_with_retries(self, prompt):
+        last_error = None
+        for attempt in range(self.retries + 1):
+            try:
+                async with self._semaphore:
+                    return await asyncio.wait_for(self.backend.generate(prompt), self.timeout)
+            except asyncio.TimeoutError:
+                last_error = LLMError(f"{self.backend.name} timed out after {self.timeout}s")
+            except Exception as e:
+                last_error = e
+            logging.warning(f"LLM attempt {attempt + 1} failed: {last_error}")
+            if attempt < self.retries:
+                # exponential backoff with full jitter so retries from many sessions don't align
+                await asyncio.sleep(random.uniform(0, self.backoff * 2 ** attempt))
+        raise LLMError(f"{self.backend.name} failed after {self.retries + 1} attempts: {last_error}")
+
+    async def _generate(self, prompt):
+        # identical prompts already in flight share one provider call
+        task = self._inflight.get(prompt)
+        if task is None:
+            task = self._loop.create_task(self._call_with_retries(prompt))
+            self._inflight[prompt] = task
+            task.add_done_callback(lambda _: self._inflight.pop(prompt, None))
+        return await asyncio.shield(task)
+
+    async def agenerate(self, prompt):
+        # awaitable from any event loop
+        return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(self._generate(prompt), self._loop))
+
+    def generate(self, prompt):
+        return asyncio.run_coroutine_threadsafe(self._generate(prompt), self._loop).result()
+
+    async def _stream_into(self, prompt, out):
+        # Retries only until the first chunk is out; the timeout applies to each gap between chunks
+        last_error = None
+        for attempt in range(self.retries + 1):
+            emitted = False
+            try:
+                async with self._semaphore:
+                    pieces = self.backend.stream(prompt).__aiter__()
+                    while True:
+                        try:
+                            piece = await asyncio.wait_for(pieces.__anext__(), self.timeout)
+                        except StopAsyncIteration:
+                            out.put(_STREAM_END)
+                            return
+                        emitted = True
+                        out.put(piece)
+            except asyncio.CancelledError:
+                raise
+            except asyncio.TimeoutError:
+                last_error = LLMError(f"{self.backend.name} stream stalled for {self.timeout}s")
+            except Exception as e:
+                last_error = e
+            logging.warning(f"LLM stream attempt {attempt + 1} failed: {last_error}")
+            if emitted:
+                break
+            if attempt < self.retries:
+                await asyncio.sleep(random.uniform(0, self.backoff * 2 ** attempt))
+        out.put(last_error if isinstance(last_error, LLMError) else LLMError(str(last_error)))
+
+    def stream(self, prompt):
+        # Sync generator of text pieces for the calling thread (e.g. st.write_stream)
+        out = queue.Queue()
+        future = asyncio.run_coroutine_threadsafe(self._stream_into(prompt, out), self._loop)
+        try:
+            while (piece := out.get()) is not _STREAM_END:
+                if isinstance(piece, LLMError):
+                    raise piece
+                yield piece
+        finally:
+            future.cancel()
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def make_backend(name=DEFAULT_BACKEND, **kwargs):
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown LLM backend {name!r}, expected one of {sorted(BACKENDS)}")
+    return BACKENDS[name](**kwargs)
+
+
+def get_llm_client():
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = LLMClient(make_backend())
+    return _client
+
+
+def set_llm_client(client):
+    # lets tests/benchmarks swap in e.g. LLMClient(StubBackend(latency=0.2))
+    global _client
+    _client = client
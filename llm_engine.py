@@ -1,19 +1,22 @@
-import google.generativeai as genai
-import os
+from llm_client import get_llm_client
 
-# Configure API key
-genai.configure(api_key="")
+# Backend (Gemini 2.5 Flash by default, llama-cpp or offline stub) is chosen by MEDAI_LLM_BACKEND
 
-# Initialize Gemini 2.5 Flash model
-model = genai.GenerativeModel("gemini-2.5-flash")
 
-def generate_answer(context, question):
-    prompt = f"""
+# Fixed text first, then the per-patient summary, then what changes every question, so
+# consecutive prompts share the longest possible prefix for provider/llama-cpp prompt caching
+PROMPT_PREFIX = """
 You are a kind and helpful nephrology assistant.
 
 Use the context below to answer the patient's question clearly.
+If a patient summary is given, keep the answer consistent with their diagnosis, medications and diet.
+"""
+
 
-Context:
+def build_prompt(context, question, patient=None):
+    patient_section = f"Patient:\n{patient}\n\n" if patient else ""
+    return f"""{PROMPT_PREFIX}
+{patient_section}Context:
 {context}
 
 Question:
@@ -21,5 +24,54 @@ Question:
 
 Answer:
 """
-    response = model.generate_content(prompt)
-    return response.text.strip()
+
+
+def clean_answer(text):
+    text = text.replace("```", "")  # prevent accidental code blocks
+    return text.replace("    ", "")  # remove excessive indentation
+
+
+class StreamCleaner:
+    # Applies strip() + clean_answer incrementally. A trailing run of spaces/backticks is held
+    # back until the next piece arrives, since it may be the start of a fence or an indent.
+    _HOLD = " `\t\r\n"
+
+    def __init__(self):
+        self._pending = ""
+        self._started = False
+
+    def feed(self, piece):
+        text = self._pending + piece
+        cut = len(text.rstrip(self._HOLD))
+        safe, self._pending = text[:cut], text[cut:]
+        if not self._started:
+            safe = safe.lstrip()
+            self._started = bool(safe)
+        return clean_answer(safe)
+
+    def flush(self):
+        tail, self._pending = self._pending, ""
+        tail = tail.rstrip() if self._started else tail.strip()
+        return clean_answer(tail)
+
+
+def generate_answer(context, question, patient=None):
+    prompt = build_prompt(context, question, patient)
+    return get_llm_client().generate(prompt).strip()
+
+
+async def agenerate_answer(context, question, patient=None):
+    prompt = build_prompt(context, question, patient)
+    return (await get_llm_client().agenerate(prompt)).strip()
+
+
+def stream_answer(context, question, patient=None):
+    # Yields cleaned answer pieces as the model produces them
+    cleaner = StreamCleaner()
+    for piece in get_llm_client().stream(build_prompt(context, question, patient)):
+        cleaned = cleaner.feed(piece)
+        if cleaned:
+            yield cleaned
+    tail = cleaner.flush()
+    if tail:
+        yield tail
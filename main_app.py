@@ -1,19 +1,44 @@
 import streamlit as st
-from patient_lookup import load_patient_data, find_patient_by_name
-from clinical_agent import run_clinical_agent
+from patient_lookup import PatientIndex
+from dialogue import DialogueEngine, Session, patient_lookup
+from intent_router import is_medical_query
+from patient_store import load_patient_records, default_patient_path
+from service_client import get_service_client
+from metrics import Trace, setup_logging
 import logging
 from datetime import datetime
 
-# Setup logging
-logging.basicConfig(
-    filename="full_medai_session.log",
-    level=logging.INFO,
-    format="%(asctime)s - %(levelname)s - %(message)s"
-)
+# Setup logging (queued, so file writes never hold up a rerun)
+setup_logging("full_medai_session.log", fmt="%(asctime)s - %(levelname)s - %(message)s")
+
+# With MEDAI_SERVICE_URL set, the agents run in service.py and this script is a thin client
+service = get_service_client()
+
+
+# Built once per server process instead of on every Streamlit rerun
+@st.cache_resource(show_spinner=False)
+def load_patient_index(path=None):
+    return PatientIndex(load_patient_records(path or default_patient_path()))
+
+
+# Runs once per server process; Streamlit reruns reuse the loaded encoder and index
+@st.cache_resource(show_spinner="Loading medical knowledge base...")
+def init_models():
+    from model_registry import warm_up
+    return warm_up()
+
+
+def clinical_stream(question, report=None):
+    if service:
+        return service.stream(question, st.session_state.service_session, report)
+    from clinical_agent import stream_clinical_agent
+    return stream_clinical_agent(question, report)
 
-patient_data = load_patient_data("patient_reports.json")
 
 st.set_page_config(page_title="MedAI Assistant", page_icon="🩺")
+if service is None:
+    init_models()
+    patient_data = load_patient_index()
 st.title("🩺 Post-Discharge Medical AI Assistant")
 
 st.markdown("""
@@ -21,29 +46,15 @@ st.markdown("""
 Please begin by typing your **full name** as it appears on your discharge report.
 """)
 
-if "state" not in st.session_state:
-    st.session_state.state = "awaiting_name"
-    st.session_state.name = ""
-    st.session_state.report = None
-    st.session_state.q_index = 0
+if "dialogue" not in st.session_state:
+    st.session_state.dialogue = Session()
     st.session_state.chat = []
-    st.session_state.questions = []
-    st.session_state.answered = []
-    st.session_state.in_clinical_mode = False
-    st.session_state.followup_mode = False
-    st.session_state.exit_ready = False
-
-def get_questions(report):
-    return [
-        f"Are you taking your medications as prescribed: {', '.join(report['medications'])}?",
-        f"Are you following your dietary restrictions: {', '.join(report['dietary_restrictions']) if isinstance(report['dietary_restrictions'], list) else report['dietary_restrictions']}?",
-        f"Have you noticed any warning signs like {', '.join(report['warning_signs']) if isinstance(report['warning_signs'], list) else report['warning_signs']}?",
-        f"Have you scheduled your follow-up: {', '.join(report['follow_up']) if isinstance(report['follow_up'], list) else report['follow_up']}?"
-    ]
-
-def is_medical_query(text):
-    keywords = ["pain", "swelling", "urine", "blood", "symptom", "dizzy", "nausea", "vomiting", "gfr", "kidney", "ai", "2025", "ml", "machine learning", "chatgpt", "dialysis", "drug", "nephrology"]
-    return any(k in text.lower() for k in keywords)
+    st.session_state.service_session = service.create_session() if service else None
+
+engine = DialogueEngine(patient_lookup(service, None if service else patient_data), is_medical_query)
+session = st.session_state.dialogue
+# kept for the clinical agent and anything else reading the patient's report
+st.session_state.report = session.report
 
 for role, msg in st.session_state.chat:
     if role == "receptionist":
@@ -63,167 +74,37 @@ user_input = st.chat_input("Type your response here...")
 
 if user_input:
     st.session_state.chat.append(("user", user_input))
-    logging.info(f"User ({st.session_state.name}): {user_input}")
+    logging.info(f"User ({session.name}): {user_input}")
     with st.chat_message("user"):
         st.markdown(user_input)
 
-    if st.session_state.state == "awaiting_name":
-        result = find_patient_by_name(user_input, patient_data)
-        if isinstance(result, str):
-            bot_msg = result
-        elif isinstance(result, list):
-            bot_msg = "Multiple matches found. Please enter full name with more detail."
-        else:
-            st.session_state.name = result["patient_name"]
-            st.session_state.report = result
-            st.session_state.questions = get_questions(result)
-            st.session_state.state = "asking_questions"
-            question = st.session_state.questions[st.session_state.q_index]
-            bot_msg = f"Hello **{result['patient_name']}**! Your diagnosis is **{result['primary_diagnosis']}**.\n\n{question}"
-
-        st.session_state.chat.append(("receptionist", bot_msg))
-        logging.info(f"Receptionist: {bot_msg}")
-        with st.chat_message("receptionist"):
-            st.markdown(bot_msg)
-
-    elif st.session_state.state == "asking_questions":
-        if is_medical_query(user_input):
-            st.session_state.in_clinical_mode = True
-            st.session_state.state = "clinical_mode"
-            st.session_state.chat.append(("receptionist", "Forwarding to Clinical Agent for medical assistance..."))
-            logging.info("Receptionist: Forwarding to Clinical Agent for medical assistance...")
-            with st.chat_message("receptionist"):
-                st.markdown("Forwarding to Clinical Agent for medical assistance...")
+    trace = Trace("ui_turn", state=session.state.name.lower())
+    with trace.stage("dialogue"):
+        turn = engine.step(session, user_input)
+    st.session_state.report = session.report
 
-            with st.spinner("Clinical Agent is analyzing..."):
-                response, src = run_clinical_agent(user_input)
-
-            st.session_state.chat.append(("clinical", response))
-            logging.info(f"Clinical Agent: {response}")
-            with st.chat_message("clinical"):
-                st.markdown(response)
-
-            st.session_state.chat.append(("source", src))
-            logging.info(f"Source: {src}")
-            with st.chat_message("source"):
-                st.markdown(f"**{src}**")
-
-        else:
-            if st.session_state.q_index not in st.session_state.answered:
-                st.session_state.answered.append(st.session_state.q_index)
-            st.session_state.q_index += 1
-            if st.session_state.q_index < len(st.session_state.questions):
-                next_q = st.session_state.questions[st.session_state.q_index]
-                st.session_state.chat.append(("receptionist", next_q))
-                logging.info(f"Receptionist: {next_q}")
-                with st.chat_message("receptionist"):
-                    st.markdown(next_q)
-            else:
-                st.session_state.state = "clinical_mode"
-                closing_msg = "Thanks for your answers. Let me know any medical issues you're facing."
-                st.session_state.chat.append(("receptionist", closing_msg))
-                logging.info(f"Receptionist: {closing_msg}")
-                with st.chat_message("receptionist"):
-                    st.markdown(closing_msg)
-
-    elif st.session_state.state == "clinical_mode":
-        lower_input = user_input.strip().lower()
-
-        if lower_input in ["bye", "exit", "thank you", "thanks"]:
-            farewell = "I hope I was able to answer all your medical queries. Transferring you back to the receptionist for any final checkups."
-            st.session_state.chat.append(("clinical", farewell))
-            logging.info(f"Clinical Agent: {farewell}")
-            with st.chat_message("clinical"):
-                st.markdown(farewell)
-
-            st.session_state.state = "followup_mode"
-            st.session_state.q_index = 0
-
-            for i in range(len(st.session_state.questions)):
-                if i not in st.session_state.answered:
-                    q = st.session_state.questions[i]
-                    st.session_state.chat.append(("receptionist", q))
-                    logging.info(f"Receptionist: {q}")
-                    with st.chat_message("receptionist"):
-                        st.markdown(q)
-                    st.session_state.q_index = i
-                    break
-            else:
-                st.session_state.state = "chatting"
-                wrap_msg = "Is there anything else I can assist you with?"
-                st.session_state.chat.append(("receptionist", wrap_msg))
-                logging.info(f"Receptionist: {wrap_msg}")
-                with st.chat_message("receptionist"):
-                    st.markdown(wrap_msg)
-
-        else:
-            st.session_state.chat.append(("receptionist", "Forwarding to Clinical Agent for medical assistance..."))
-            logging.info("Receptionist: Forwarding to Clinical Agent for medical assistance...")
-            with st.chat_message("receptionist"):
-                st.markdown("Forwarding to Clinical Agent for medical assistance...")
+    for role, msg in turn.messages:
+        st.session_state.chat.append((role, msg))
+        logging.info(f"{'Receptionist' if role == 'receptionist' else 'Clinical Agent'}: {msg}")
+        with st.chat_message(role):
+            st.markdown(msg)
 
+    if turn.clinical_question:
+        with st.chat_message("clinical"):
             with st.spinner("Clinical Agent is analyzing..."):
-                response, src = run_clinical_agent(user_input)
-
-            st.session_state.chat.append(("clinical", response))
-            logging.info(f"Clinical Agent: {response}")
-            with st.chat_message("clinical"):
-                st.markdown(response)
-
-            st.session_state.chat.append(("source", src))
-            logging.info(f"Source: {src}")
-            with st.chat_message("source"):
-                st.markdown(f"**{src}**")
-
-    elif st.session_state.state == "followup_mode":
-        if st.session_state.q_index < len(st.session_state.questions):
-            if st.session_state.q_index not in st.session_state.answered:
-                st.session_state.answered.append(st.session_state.q_index)
-            st.session_state.q_index += 1
-            for i in range(st.session_state.q_index, len(st.session_state.questions)):
-                if i not in st.session_state.answered:
-                    q = st.session_state.questions[i]
-                    st.session_state.chat.append(("receptionist", q))
-                    logging.info(f"Receptionist: {q}")
-                    with st.chat_message("receptionist"):
-                        st.markdown(q)
-                    st.session_state.q_index = i
-                    break
-            else:
-                st.session_state.state = "chatting"
-                st.session_state.chat.append(("receptionist", "Is there anything else I can assist you with?"))
-                logging.info("Receptionist: Is there anything else I can assist you with?")
-                with st.chat_message("receptionist"):
-                    st.markdown("Is there anything else I can assist you with?")
-
-    elif st.session_state.state == "chatting":
-        lower_input = user_input.strip().lower()
-        if lower_input in ["bye", "exit", "goodbye"]:
-            farewell = "Thank you for using MedAI Assistant. Wishing you good health and a speedy recovery! 👋"
-            st.session_state.chat.append(("receptionist", farewell))
-            logging.info(f"Receptionist: {farewell}")
-            with st.chat_message("receptionist"):
-                st.markdown(farewell)
-            st.session_state.state = "done"
-        elif is_medical_query(user_input):
-            st.session_state.state = "clinical_mode"
-        else:
-            if st.session_state.q_index < len(st.session_state.questions):
-                if st.session_state.q_index not in st.session_state.answered:
-                    st.session_state.answered.append(st.session_state.q_index)
-                st.session_state.q_index += 1
-                for i in range(st.session_state.q_index, len(st.session_state.questions)):
-                    if i not in st.session_state.answered:
-                        q = st.session_state.questions[i]
-                        st.session_state.chat.append(("receptionist", q))
-                        logging.info(f"Receptionist: {q}")
-                        with st.chat_message("receptionist"):
-                            st.markdown(q)
-                        st.session_state.q_index = i
-                        break
-            else:
-                final_msg = "You may still ask questions or type 'bye' to end the session."
-                st.session_state.chat.append(("receptionist", final_msg))
-                logging.info(f"Receptionist: {final_msg}")
-                with st.chat_message("receptionist"):
-                    st.markdown(final_msg)
\ No newline at end of file
+                with trace.stage("clinical_setup"):
+                    stream = clinical_stream(turn.clinical_question, st.session_state.report)
+            with trace.stage("render"):
+                response = st.write_stream(stream)
+        src = stream.source
+        trace.annotate(clinical_trace=getattr(getattr(stream, "trace", None), "id", None), source=src)
+
+        st.session_state.chat.append(("clinical", response))
+        logging.info(f"Clinical Agent: {response}")
+
+        st.session_state.chat.append(("source", src))
+        logging.info(f"Source: {src}")
+        with st.chat_message("source"):
+            st.markdown(f"**{src}**")
+
+    trace.finish()
@@ -0,0 +1,272 @@
+import argparse
+import atexit
+import contextvars
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import threading
+import time
+import uuid
+from bisect import bisect_left
+from collections import defaultdict
+from contextlib import contextmanager
+import numpy as np
+
+METRICS_PATH = os.environ.get("MEDAI_METRICS_PATH", "medai_metrics.jsonl")    # "" turns the JSONL sink off
+# latency histogram upper bounds in milliseconds, shared by every stage
+BUCKETS_MS = (1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000)
+PERCENTILES = (50, 95, 99)
+
+
+def queued_handler(*handlers):
+    # QueueHandler for the caller, with the real (file) handlers run on a listener thread
+    q = queue.SimpleQueue()
+    listener = logging.handlers.QueueListener(q, *handlers, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+    handler = logging.handlers.QueueHandler(q)
+    handler.listener = listener    # for flush_sink
+    return handler
+
+
+def setup_logging(filename, level=logging.INFO, fmt=logging.BASIC_FORMAT):
+    # logging.basicConfig(filename=...) with the file writes moved off the request thread;
+    # like basicConfig, does nothing if the root logger is already configured
+    root = logging.getLogger()
+    if root.handlers:
+        return
+    file_handler = logging.FileHandler(filename, encoding="utf-8")
+    file_handler.setFormatter(logging.Formatter(fmt))
+    root.addHandler(queued_handler(file_handler))
+    root.setLevel(level)
+
+
+class Histogram:
+    def __init__(self, buckets=BUCKETS_MS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)    # last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Metrics:
+    # In-process stage histograms and event counters, rendered in Prometheus text format
+    def __init__(self, buckets=BUCKETS_MS):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self.histograms = {}
+        self.counters = defaultdict(int)
+
+    def observe(self, stage, ms):
+        with self._lock:
+            if stage not in self.histograms:
+                self.histograms[stage] = Histogram(self.buckets)
+            self.histograms[stage].observe(ms)
+
+    def count(self, event, value=1):
+        with self._lock:
+            self.counters[event] += value
+
+    def render_prometheus(self):
+        lines = ["# HELP medai_stage_latency_ms Time spent per pipeline stage",
+                 "# TYPE medai_stage_latency_ms histogram"]
+        with self._lock:
+            for stage, h in sorted(self.histograms.items()):
+                cumulative = 0
+                for le, n in zip([*map(str, h.buckets), "+Inf"], h.counts):
+                    cumulative += n
+                    lines.append(f'medai_stage_latency_ms_bucket{{stage="{stage}",le="{le}"}} {cumulative}')
+                lines.append(f'medai_stage_latency_ms_sum{{stage="{stage}"}} {h.sum:.3f}')
+                lines.append(f'medai_stage_latency_ms_count{{stage="{stage}"}} {h.count}')
+            lines += ["# HELP medai_events_total Cache hits/misses and other pipeline events",
+                      "# TYPE medai_events_total counter"]
+            for event, n in sorted(self.counters.items()):
+                lines.append(f'medai_events_total{{event="{event}"}} {n}')
+        return "\n".join(lines) + "\n"
+
+
+metrics = Metrics()
+_sink = None
+_sink_lock = threading.Lock()
+
+
+def get_sink(path=METRICS_PATH):
+    # logger writing one JSON object per line through a queue, so emitting never waits on disk
+    global _sink
+    if _sink is None:
+        with _sink_lock:
+            if _sink is None:
+                sink = logging.getLogger("medai.metrics")
+                sink.propagate = False
+                sink.setLevel(logging.INFO)
+                if path:
+                    file_handler = logging.FileHandler(path, encoding="utf-8")
+                    file_handler.setFormatter(logging.Formatter("%(message)s"))
+                    sink.addHandler(queued_handler(file_handler))
+                _sink = sink
+    return _sink
+
+
+def flush_sink():
+    # blocks until every record queued so far is on disk, for readers in this process (benchmark.py)
+    for handler in get_sink().handlers:
+        listener = getattr(handler, "listener", None)
+        if listener is not None:
+            listener.stop()    # drains the queue before the thread exits
+            listener.start()
+
+
+_current = contextvars.ContextVar("medai_trace", default=None)
+
+
+class Trace:
+    # Timings and attributes of one request, written as a single JSONL record by finish()
+    def __init__(self, kind, **attrs):
+        self.id = uuid.uuid4().hex[:16]
+        self.kind = kind
+        self.started = time.time()
+        self._start = time.perf_counter()
+        self.stages = {}
+        self.attrs = dict(attrs)
+        self.finished = False
+
+    def add(self, stage, ms):
+        self.stages[stage] = self.stages.get(stage, 0.0) + ms
+        metrics.observe(stage, ms)
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield self
+        finally:
+            self.add(name, (time.perf_counter() - start) * 1000)
+
+    def annotate(self, **attrs):
+        self.attrs.update(attrs)
+
+    def cache_result(self, cache, hit):
+        self.attrs[f"{cache}_hit"] = hit
+        metrics.count(f"{cache}_{'hit' if hit else 'miss'}")
+
+    @contextmanager
+    def activate(self):
+        # makes this the trace that module-level stage()/annotate() report into
+        token = _current.set(self)
+        try:
+            yield self
+        finally:
+            _current.reset(token)
+
+    def finish(self, **attrs):
+        if self.finished:
+            return
+        self.finished = True
+        self.attrs.update(attrs)
+        total = (time.perf_counter() - self._start) * 1000
+        metrics.observe(f"{self.kind}_total", total)
+        record = {"ts": round(self.started, 3), "trace": self.id, "kind": self.kind, "total_ms": round(total, 3),
+                  "stages": {k: round(v, 3) for k, v in self.stages.items()}, **self.attrs}
+        get_sink().info(json.dumps(record, default=str, separators=(",", ":")))
+
+
+def current_trace():
+    return _current.get()
+
+
+@contextmanager
+def stage(name):
+    # times a block into the current trace, or only into the histograms outside a request
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        ms = (time.perf_counter() - start) * 1000
+        trace = _current.get()
+        if trace is not None:
+            trace.add(name, ms)
+        else:
+            metrics.observe(name, ms)
+
+
+def annotate(**attrs):
+    trace = _current.get()
+    if trace is not None:
+        trace.annotate(**attrs)
+
+
+def cache_result(cache, hit):
+    trace = _current.get()
+    if trace is not None:
+        trace.cache_result(cache, hit)
+    else:
+        metrics.count(f"{cache}_{'hit' if hit else 'miss'}")
+
+
+def read_records(path=METRICS_PATH, kind=None):
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                record = json.loads(line)
+                if kind is None or record["kind"] == kind:
+                    yield record
+
+
+def summarize(records):
+    # {stage: {"count", "p50", "p95", "p99", "max"}} plus hit rates of every *_hit flag
+    timings = defaultdict(list)
+    hits = defaultdict(lambda: [0, 0])
+    for record in records:
+        timings[f"{record['kind']}_total"].append(record["total_ms"])
+        for stage_name, ms in record["stages"].items():
+            timings[stage_name].append(ms)
+        for key, value in record.items():
+            if key.endswith("_hit") and isinstance(value, bool):
+                hits[key[:-4]][0] += value
+                hits[key[:-4]][1] += 1
+    stages = {}
+    for name, values in sorted(timings.items()):
+        values = np.asarray(values)
+        pcts = np.percentile(values, PERCENTILES)
+        stages[name] = {"count": len(values), **{f"p{p}": float(v) for p, v in zip(PERCENTILES, pcts)},
+                        "max": float(values.max())}
+    return {"stages": stages, "hit_rates": {k: hit / n for k, (hit, n) in sorted(hits.items())}}
+
+
+def print_summary(summary):
+    print(f"{'stage':<24}{'count':>8}{'p50 ms':>11}{'p95 ms':>11}{'p99 ms':>11}{'max ms':>11}")
+    for name, s in summary["stages"].items():
+        print(f"{name:<24}{s['count']:>8}{s['p50']:>11.1f}{s['p95']:>11.1f}{s['p99']:>11.1f}{s['max']:>11.1f}")
+    if summary["hit_rates"]:
+        print()
+        for cache, rate in summary["hit_rates"].items():
+            print(f"{cache + ' hit rate':<24}{rate:>8.1%}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Summarize per-stage latency from the JSONL metrics sink")
+    parser.add_argument("--path", default=METRICS_PATH or "medai_metrics.jsonl")
+    parser.add_argument("--kind", help="only requests of this kind (clinical, clinical_stream, ui_turn, ...)")
+    parser.add_argument("--format", choices=["table", "json", "prometheus"], default="table")
+    args = parser.parse_args()
+
+    records = list(read_records(args.path, args.kind))
+    if args.format == "prometheus":
+        replay = Metrics()
+        for record in records:
+            replay.observe(f"{record['kind']}_total", record["total_ms"])
+            for stage_name, ms in record["stages"].items():
+                replay.observe(stage_name, ms)
+        print(replay.render_prometheus(), end="")
+    elif args.format == "json":
+        print(json.dumps(summarize(records), indent=2))
+    else:
+        print(f"{len(records)} requests from {args.path}\n")
+        print_summary(summarize(records))
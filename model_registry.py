@@ -0,0 +1,130 @@
+import os
+import json
+import pickle
+import threading
+import logging
+import faiss
+from embedding_backend import EMBED_BACKEND, QUERY_CACHE_PATH, make_embedder, CachedQueryEncoder
+from retrieval import BM25Index
+from chunk_store import ChunkStore, has_chunk_store
+from metrics import stage
+
+INDEX_DIR = "embeddings/faiss_index"
+
+
+def set_search_params(index, params):
+    # search-time knobs from index_meta.json (written by process_pdf.save_to_faiss)
+    ps = faiss.ParameterSpace()
+    if "nprobe" in params:
+        ps.set_index_parameter(index, "nprobe", params["nprobe"])
+    if "ef_search" in params:
+        ps.set_index_parameter(index, "efSearch", params["ef_search"])
+
+
+def load_index_meta(index_dir=INDEX_DIR):
+    path = os.path.join(index_dir, "index_meta.json")
+    if not os.path.exists(path):
+        return {"index_type": "flat"}    # indexes built before index_meta.json existed
+    with open(path) as f:
+        return json.load(f)
+
+
+def load_chunks(index_dir=INDEX_DIR):
+    # memory-mapped ChunkStore; chunks.pkl only for indexes built before the store existed
+    if has_chunk_store(index_dir):
+        return ChunkStore(index_dir)
+    with open(os.path.join(index_dir, "chunks.pkl"), "rb") as f:
+        return pickle.load(f)
+
+
+class ModelRegistry:
+    # Process-wide holder for the encoder and FAISS index so they load once,
+    # not once per question. The index is reloaded when process_pdf replaces faiss.index.
+    def __init__(self, embed_backend=EMBED_BACKEND, index_dir=INDEX_DIR, query_cache_path=QUERY_CACHE_PATH):
+        self.embed_backend = embed_backend
+        self.index_dir = index_dir
+        self.query_cache_path = query_cache_path
+        self._lock = threading.Lock()
+        self._model = None
+        self._query_encoder = None
+        self._index = None
+        self._chunks = None
+        self._version = None
+        self.index_meta = {}
+        self._bm25 = None
+        self._bm25_version = None
+
+    def index_version(self):
+        # (mtime_ns, size) of faiss.index only. process_pdf replaces it after the chunk store and
+        # index_meta.json, so a change here means the whole rebuild is on disk; watching the other
+        # files could reload a new chunks.bin with the old offsets halfway through a rewrite.
+        path = os.path.join(self.index_dir, "faiss.index")
+        return (os.stat(path).st_mtime_ns, os.stat(path).st_size) if os.path.exists(path) else None
+
+    def get_model(self):
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    logging.info(f"Loading embedding backend: {self.embed_backend}")
+                    with stage("model_load"):
+                        self._model = make_embedder(self.embed_backend)
+        return self._model
+
+    def get_query_encoder(self):
+        # the embedder behind an LRU + disk cache keyed on normalized question text
+        if self._query_encoder is None:
+            model = self.get_model()
+            with self._lock:
+                if self._query_encoder is None:
+                    self._query_encoder = CachedQueryEncoder(model, self.query_cache_path)
+        return self._query_encoder
+
+    def get_index(self):
+        version = self.index_version()
+        if self._index is None or version != self._version:
+            with self._lock:
+                if self._index is None or version != self._version:
+                    logging.info(f"Loading FAISS index from {self.index_dir}")
+                    with stage("index_load"):
+                        index = faiss.read_index(os.path.join(self.index_dir, "faiss.index"))
+                        self.index_meta = load_index_meta(self.index_dir)
+                        set_search_params(index, self.index_meta)
+                        chunks = load_chunks(self.index_dir)
+                    self._index, self._chunks, self._version = index, chunks, version
+        return self._index, self._chunks
+
+    def get_bm25(self):
+        # lexical index over the same chunks, rebuilt whenever the FAISS index is reloaded
+        _, chunks = self.get_index()
+        if self._bm25 is None or self._bm25_version != self._version:
+            with self._lock:
+                if self._bm25 is None or self._bm25_version != self._version:
+                    version = self._version
+                    with stage("bm25_build"):
+                        self._bm25 = BM25Index(chunks)
+                    self._bm25_version = version
+        return self._bm25
+
+    def warm_up(self):
+        # Load everything up front so the first patient question doesn't pay for it
+        self.get_query_encoder()
+        self.get_bm25()
+        self.get_model().encode(["warm up"])
+        return self
+
+
+registry = ModelRegistry()
+
+
+def get_registry():
+    return registry
+
+
+def set_registry(new_registry):
+    # lets tests/benchmarks point the agents at another index or embedding backend
+    global registry
+    registry = new_registry
+
+
+def warm_up():
+    return registry.warm_up()
@@ -1,25 +1,171 @@
 import json
-from typing import List, Union
+import re
+import unicodedata
+from bisect import bisect_left, insort
+from collections import defaultdict
+from typing import Dict, List, Optional, Sequence, Union
+
+NOT_FOUND = "Patient not found!!"
+
+_NON_ALNUM = re.compile(r"[\W_]+", re.UNICODE)
+
 
 def load_patient_data(file_path: str) -> List[dict]:
     with open(file_path, "r") as f:
         return json.load(f)
-    
-def find_patient_by_name(name: str, patient_data: List[dict]) -> Union[dict, List[dict], str]:
+
+
+def normalize_name(name: str) -> str:
+    # casefold, drop accents, collapse whitespace/punctuation: "  O'Brien,  José " -> "o brien jose"
+    text = unicodedata.normalize("NFKD", name)
+    text = "".join(c for c in text if not unicodedata.combining(c)).casefold()
+    return _NON_ALNUM.sub(" ", text).strip()
+
+
+def _trigrams(key: str) -> set:
+    padded = f"  {key} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def _edit_distance(a: str, b: str, max_dist: int) -> int:
+    # Banded Levenshtein; returns max_dist + 1 as soon as the distance is known to exceed it
+    if abs(len(a) - len(b)) > max_dist:
+        return max_dist + 1
+    prev = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        cur = [i] + [0] * len(b)
+        for j, cb in enumerate(b, 1):
+            cur[j] = min(prev[j] + 1, cur[j - 1] + 1, prev[j - 1] + (ca != cb))
+        if min(cur) > max_dist:
+            return max_dist + 1
+        prev = cur
+    return prev[-1]
+
+
+class PatientIndex:
+    # Built once over the roster; every lookup afterwards is a dict hit instead of a scan.
+    def __init__(self, records: Sequence[dict], secondary_keys=("discharge_date",)):
+        self.records = records
+        self._by_name: Dict[str, List[int]] = defaultdict(list)
+        self._by_field: Dict[str, Dict[str, List[int]]] = {k: defaultdict(list) for k in secondary_keys}
+
+        # a PatientStore hands over just the name/key fields, so no report is decoded here
+        fields = {"patient_name", *secondary_keys}
+        rows = records.iter_keys() if fields <= set(getattr(records, "key_fields", ())) else records
+        for pos, record in enumerate(rows):
+            self._index_record(pos, record)
+
+        self._sorted_keys = sorted(self._by_name)
+        self._trigram_index: Optional[Dict[str, List[int]]] = None
+
+    def _index_record(self, pos: int, record: dict) -> str:
+        key = normalize_name(record["patient_name"])
+        self._by_name[key].append(pos)
+        for field, table in self._by_field.items():
+            if record.get(field) is not None:
+                table[str(record[field])].append(pos)
+        return key
+
+    def add(self, record: dict) -> int:
+        # Appends to the underlying list/PatientStore and indexes only the new record
+        pos = self.records.append(record)
+        if pos is None:
+            pos = len(self.records) - 1
+        is_new_key = normalize_name(record["patient_name"]) not in self._by_name
+        key = self._index_record(pos, record)
+        if is_new_key:
+            insort(self._sorted_keys, key)
+            self._trigram_index = None
+        return pos
+
+    def __len__(self):
+        return len(self.records)
+
+    def _records_at(self, positions: List[int]) -> List[dict]:
+        return [self.records[p] for p in positions]
+
+    def find(self, name: str) -> List[dict]:
+        return self._records_at(self._by_name.get(normalize_name(name), []))
+
+    def lookup(self, name: str) -> Union[dict, List[dict], str]:
+        # Same contract as find_patient_by_name: record / list of records / not-found message
+        matches = self.find(name)
+        if len(matches) == 0:
+            return NOT_FOUND
+        elif len(matches) == 1:
+            return matches[0]
+        else:
+            return matches
+
+    def find_by(self, field: str, value) -> List[dict]:
+        return self._records_at(self._by_field[field].get(str(value), []))
+
+    def prefix_search(self, prefix: str, limit: int = 10) -> List[str]:
+        # Normalized names starting with the prefix, in sorted order
+        key = normalize_name(prefix)
+        start = bisect_left(self._sorted_keys, key)
+        results = []
+        for candidate in self._sorted_keys[start:]:
+            if not candidate.startswith(key) or len(results) >= limit:
+                break
+            results.append(candidate)
+        return results
+
+    def _build_trigram_index(self):
+        index = defaultdict(list)
+        for key_id, key in enumerate(self._sorted_keys):
+            for gram in _trigrams(key):
+                index[gram].append(key_id)
+        self._trigram_index = index
+
+    def fuzzy_search(self, name: str, max_distance: int = 2, limit: int = 5) -> List[str]:
+        # Typo-tolerant candidates: trigram overlap narrows the roster, edit distance ranks it
+        if self._trigram_index is None:
+            self._build_trigram_index()
+        key = normalize_name(name)
+        grams = _trigrams(key)
+        overlap = defaultdict(int)
+        for gram in grams:
+            for key_id in self._trigram_index.get(gram, ()):
+                overlap[key_id] += 1
+
+        # a key within max_distance edits shares at least this many trigrams with the query
+        min_overlap = max(1, len(grams) - 3 * max_distance)
+        scored = []
+        for key_id, count in overlap.items():
+            if count < min_overlap:
+                continue
+            candidate = self._sorted_keys[key_id]
+            dist = _edit_distance(key, candidate, max_distance)
+            if dist <= max_distance:
+                scored.append((dist, -count, candidate))
+        scored.sort()
+        return [candidate for _, _, candidate in scored[:limit]]
+
+
+def find_patient_by_name(name: str, patient_data: Union[List[dict], PatientIndex]) -> Union[dict, List[dict], str]:
+    if isinstance(patient_data, PatientIndex):
+        return patient_data.lookup(name)
+
     matches = [p for p in patient_data if p["patient_name"].lower() == name.lower()]
 
     if len(matches) == 0:
-        return "Patient not found!!"
+        return NOT_FOUND
     elif len(matches) == 1:
         return matches[0]
     else:
         return matches
-    
+
+
 if __name__ == "__main__":
-    data = load_patient_data("patient_reports.json")
+    data = PatientIndex(load_patient_data("patient_reports.json"))
 
     input_name = input("Enter patient name: ")
     result = find_patient_by_name(input_name, data)
 
     print("\nLookup Result:\n")
-    print(result)
\ No newline at end of file
+    print(result)
+    if result == NOT_FOUND:
+        suggestions = data.fuzzy_search(input_name)
+        if suggestions:
+            print("Did you mean: " + ", ".join(suggestions))
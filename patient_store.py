@@ -0,0 +1,205 @@
+import json
+import mmap
+import os
+import sys
+from typing import Iterator, List, Union
+
+from patient_lookup import load_patient_data
+
+# Record i lives at data[offsets[i]:offsets[i + 1]] (or to EOF for the last one).
+# Offsets are little-endian uint64 in "<store>.idx", both files are memory-mapped.
+# "<store>.keys" repeats KEY_FIELDS of record i on line i, tab-separated, so PatientIndex
+# can be built without decoding any report.
+_OFFSET_SIZE = 8
+KEY_FIELDS = ("patient_name", "discharge_date")
+
+
+def _keys_line(record: dict) -> str:
+    values = ("" if record.get(f) is None else str(record[f]) for f in KEY_FIELDS)
+    return "\t".join(v.replace("\t", " ").replace("\n", " ") for v in values) + "\n"
+
+
+def _map(path):
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return b""
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+class PatientStore:
+    # JSONL roster with a memory-mapped offset index. Records are decoded only when
+    # accessed, so opening a roster costs nothing regardless of its size.
+    key_fields = KEY_FIELDS
+
+    def __init__(self, path: str):
+        self.path = path
+        self.index_path = path + ".idx"
+        self.keys_path = path + ".keys"
+        if not os.path.exists(self.path):
+            open(self.path, "wb").close()
+        if not self._index_is_current():
+            self.rebuild_index()
+        self._open()
+        if not self._keys_are_current():
+            self.rebuild_keys()
+
+    def _index_is_current(self):
+        if not os.path.exists(self.index_path):
+            return False
+        data_size = os.path.getsize(self.path)
+        idx_size = os.path.getsize(self.index_path)
+        if idx_size % _OFFSET_SIZE or (idx_size == 0) != (data_size == 0):
+            return False
+        if idx_size == 0:
+            return True
+        with open(self.index_path, "rb") as f:
+            f.seek(idx_size - _OFFSET_SIZE)
+            last_start = int.from_bytes(f.read(_OFFSET_SIZE), "little")
+        # a crash between the data write and the index write leaves extra data past the last record
+        with open(self.path, "rb") as f:
+            f.seek(last_start)
+            f.readline()
+            return f.tell() == data_size
+
+    def rebuild_index(self):
+        with open(self.path, "rb") as src, open(self.index_path, "wb") as idx:
+            offset = 0
+            for line in src:
+                if line.strip():
+                    idx.write(offset.to_bytes(_OFFSET_SIZE, "little"))
+                offset += len(line)
+
+    def _keys_are_current(self):
+        # written after the data on every path, so an older sidecar belongs to an overwritten roster
+        if not os.path.exists(self.keys_path) or os.path.getmtime(self.keys_path) < os.path.getmtime(self.path):
+            return False
+        with open(self.keys_path, "rb") as f:
+            return f.read().count(b"\n") == len(self)
+
+    def rebuild_keys(self):
+        # decodes every record once; only for rosters written without the sidecar
+        with open(self.keys_path, "w", encoding="utf-8") as f:
+            for record in self:
+                f.write(_keys_line(record))
+
+    def iter_keys(self) -> Iterator[dict]:
+        # {field: value} of KEY_FIELDS for every record, in order, read from the sidecar
+        with open(self.keys_path, "r", encoding="utf-8") as f:
+            for line in f:
+                yield {field: value or None for field, value in zip(KEY_FIELDS, line.rstrip("\n").split("\t"))}
+
+    def _open(self):
+        self._data = _map(self.path)
+        self._idx = _map(self.index_path)
+        self._offsets = memoryview(self._idx).cast("Q") if self._idx else []
+
+    def close(self):
+        if isinstance(self._offsets, memoryview):
+            self._offsets.release()
+        for m in (self._data, self._idx):
+            if isinstance(m, mmap.mmap):
+                m.close()
+
+    def __len__(self):
+        return len(self._offsets)
+
+    def __getitem__(self, i: int) -> dict:
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError("patient record index out of range")
+        start = self._offsets[i]
+        end = self._offsets[i + 1] if i + 1 < len(self) else len(self._data)
+        return json.loads(self._data[start:end])
+
+    def __iter__(self) -> Iterator[dict]:
+        for i in range(len(self)):
+            yield self[i]
+
+    def append(self, record: dict) -> int:
+        # New discharges go to the end of both files; existing bytes are never rewritten
+        line = (json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8")
+        with open(self.path, "ab") as f:
+            offset = f.tell()
+            f.write(line)
+        with open(self.keys_path, "a", encoding="utf-8") as keys:
+            keys.write(_keys_line(record))
+        with open(self.index_path, "ab") as idx:
+            idx.write(offset.to_bytes(_OFFSET_SIZE, "little"))
+        self.close()
+        self._open()
+        return len(self) - 1
+
+
+def iter_json_array(file_path: str, chunk_size: int = 1 << 16) -> Iterator[dict]:
+    # Yields the elements of a top-level JSON array without loading the whole file
+    decoder = json.JSONDecoder()
+    with open(file_path, "r", encoding="utf-8") as f:
+        buf, pos, eof, started = "", 0, False, False
+        while True:
+            pos = _skip_ws(buf, pos)
+            if pos == len(buf) and not eof:
+                buf, pos = buf[pos:] + f.read(chunk_size), 0
+                eof = pos == len(buf)
+                continue
+            if not started:
+                if not buf.startswith("[", pos):
+                    raise ValueError(f"{file_path} is not a JSON array")
+                pos, started = pos + 1, True
+            elif buf.startswith(",", pos):
+                pos += 1
+            elif buf.startswith("]", pos):
+                return
+            else:
+                try:
+                    obj, pos = decoder.raw_decode(buf, pos)
+                except json.JSONDecodeError:
+                    if eof:
+                        raise
+                    # element spans the chunk boundary: keep the tail and read more
+                    chunk = f.read(chunk_size)
+                    buf, pos, eof = buf[pos:] + chunk, 0, not chunk
+                    continue
+                yield obj
+
+
+def _skip_ws(buf, pos):
+    while pos < len(buf) and buf[pos] in " \t\r\n":
+        pos += 1
+    return pos
+
+
+def convert_json_to_store(json_path: str, store_path: str) -> int:
+    # Streaming conversion of the legacy patient_reports.json array into a PatientStore
+    tmp_path = store_path + ".tmp"
+    count = 0
+    with open(tmp_path, "w", encoding="utf-8") as out, open(store_path + ".keys.tmp", "w", encoding="utf-8") as keys:
+        for record in iter_json_array(json_path):
+            out.write(json.dumps(record, ensure_ascii=False) + "\n")
+            keys.write(_keys_line(record))
+            count += 1
+    os.replace(tmp_path, store_path)
+    os.replace(store_path + ".keys.tmp", store_path + ".keys")
+    os.utime(store_path + ".keys")    # newer than the data, see PatientStore._keys_are_current
+    if os.path.exists(store_path + ".idx"):
+        os.remove(store_path + ".idx")
+    PatientStore(store_path).close()
+    return count
+
+
+def default_patient_path() -> str:
+    # prefer the memory-mapped store (python patient_store.py) over the legacy JSON array
+    return "patient_reports.jsonl" if os.path.exists("patient_reports.jsonl") else "patient_reports.json"
+
+
+def load_patient_records(file_path: str) -> Union[PatientStore, List[dict]]:
+    if file_path.endswith(".jsonl"):
+        return PatientStore(file_path)
+    return load_patient_data(file_path)
+
+
+if __name__ == "__main__":
+    src = sys.argv[1] if len(sys.argv) > 1 else "patient_reports.json"
+    dst = sys.argv[2] if len(sys.argv) > 2 else "patient_reports.jsonl"
+    n = convert_json_to_store(src, dst)
+    print(f"Converted {n} patient records from {src} to {dst}")
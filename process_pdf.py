@@ -1,46 +1,470 @@
 import fitz  # to extract text
-from langchain.text_splitter import RecursiveCharacterTextSplitter   # to split into word chunks
-from sentence_transformers import SentenceTransformer   # to embedd chunks(vector reprn)
 import faiss    #vector database
+from model_registry import get_registry, set_search_params, load_index_meta, load_chunks
+from chunk_store import write_chunk_store, read_chunk_store, has_chunk_store
+from concurrent.futures import ProcessPoolExecutor
+from collections import deque
+from collections.abc import Mapping
+from itertools import islice
+import numpy as np
+import argparse
+import hashlib
+import json
+import math
 import os
 import pickle
+import time
+
+PAGES_PER_TASK = 16
+EMBED_BATCH_SIZE = 256
 
 def extract_pdf_text(pdf_path):
     doc = fitz.open(pdf_path)
-    full_text = ""
-    for page in doc:
-        full_text += page.get_text()
-    return full_text
+    return "".join(page.get_text() for page in doc)
+
+
+def _extract_page_range(pdf_path, start, stop):
+    # runs in a worker process: each worker opens its own handle on the PDF
+    doc = fitz.open(pdf_path)
+    return [(page_no + 1, doc[page_no].get_text()) for page_no in range(start, stop)]
+
+
+def iter_pdf_pages(pdf_path, workers=None, pages_per_task=PAGES_PER_TASK):
+    # Yields (page_no, text) in page order while a process pool extracts the pages ahead of us.
+    # At most 2 * workers page ranges are in flight, so memory stays bounded for huge PDFs.
+    with fitz.open(pdf_path) as doc:
+        page_count = doc.page_count
+    workers = workers or os.cpu_count() or 1
+    ranges = [(start, min(start + pages_per_task, page_count)) for start in range(0, page_count, pages_per_task)]
+
+    if workers == 1 or len(ranges) <= 1:
+        for start, stop in ranges:
+            yield from _extract_page_range(pdf_path, start, stop)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        todo = iter(ranges)
+        for start, stop in islice(todo, 2 * workers):
+            pending.append(pool.submit(_extract_page_range, pdf_path, start, stop))
+        while pending:
+            pages = pending.popleft().result()
+            for start, stop in islice(todo, 1):
+                pending.append(pool.submit(_extract_page_range, pdf_path, start, stop))
+            yield from pages
+
+
+_splitter = None
+
+def _get_splitter():
+    global _splitter
+    if _splitter is None:
+        from langchain.text_splitter import RecursiveCharacterTextSplitter   # to split into word chunks; only the PDF path needs it
+        _splitter = RecursiveCharacterTextSplitter(
+            chunk_size = 500,
+            chunk_overlap = 50  #each chunk shares 50 char with prev one
+        )
+    return _splitter
 
 
 def split_text_into_chunks(text):
-    splitter = RecursiveCharacterTextSplitter(
-        chunk_size = 500,
-        chunk_overlap = 50  #each chunk shares 50 char with prev one
-    )
-    return splitter.split_text(text)
+    return _get_splitter().split_text(text)
+
+
+def iter_chunks(pages):
+    # chunks each page as soon as it arrives: yields (page_no, chunk, start, end), the span within the page
+    for page_no, text in pages:
+        cursor = 0
+        for chunk in split_text_into_chunks(text):
+            start = text.find(chunk, cursor)
+            if start < 0:
+                start = text.find(chunk)
+            end = start + len(chunk) if start >= 0 else -1
+            cursor = max(cursor, start + 1)
+            yield page_no, chunk, start, end
+
+
+def batched(iterable, size):
+    it = iter(iterable)
+    while batch := list(islice(it, size)):
+        yield batch
 
 
-def create_embeddings(chunks):
-    model = SentenceTransformer("all-MiniLM-L6-v2")   # sentence transformer model with 6 transformer layers and gives embedding vector of 384 dimensions
-    embeddings = model.encode(chunks)
+def create_embeddings(chunks, batch_size=EMBED_BATCH_SIZE):
+    model = get_registry().get_model()   # sentence transformer model with 6 transformer layers and gives embedding vector of 384 dimensions
+    embeddings = model.encode(chunks, batch_size=batch_size)
     return embeddings
 
 
-def save_to_faiss(embeddings, chunks, index_path="embeddings/faiss_index"):
-    dimension = embeddings.shape[1]    #stores how many numbers in each vector
-    index = faiss.IndexFlatL2(dimension)    #creates faiss index with L2(Euclidean distance)
+def iter_embeddings(chunks, batch_size=EMBED_BATCH_SIZE):
+    # fixed-size batches into the encoder: yields (chunk_batch, embeddings)
+    for batch in batched(chunks, batch_size):
+        yield batch, create_embeddings(batch, batch_size)
+
+
+def embed_pdf(pdf_path, workers=None):
+    # streaming build path: extract (parallel) -> chunk -> embed, one batch at a time
+    source = os.path.basename(pdf_path)
+    chunks, metas, parts = [], [], []
+
+    def texts():
+        for page_no, chunk, start, end in iter_chunks(iter_pdf_pages(pdf_path, workers)):
+            metas.append((source, page_no, start, end))
+            yield chunk
+
+    for batch, embeddings in iter_embeddings(texts()):
+        chunks.extend(batch)
+        parts.append(np.asarray(embeddings, dtype="float32"))
+        print(f"🧩 Embedded {len(chunks)} chunks", end="\r")
+    print()
+    return chunks, metas, np.vstack(parts)
+
+
+INDEX_TYPES = ("flat", "ivf", "hnsw", "ivfpq")
+
+# below these sizes k-means/PQ training is unreliable, so we fall back to a simpler index
+MIN_POINTS_PER_CENTROID = 39
+PQ_NBITS = 8
+
+
+def choose_index_params(n, dimension, index_type, nlist=None, nprobe=None, hnsw_m=32,
+                        ef_construction=200, ef_search=64, pq_m=None):
+    if index_type == "ivfpq" and n < MIN_POINTS_PER_CENTROID * 2 ** PQ_NBITS:
+        print(f"⚠️ Only {n} chunks, too few to train PQ; using ivf instead")
+        index_type = "ivf"
+    if index_type in ("ivf", "ivfpq"):
+        nlist = nlist or max(1, min(int(4 * math.sqrt(n)), n // MIN_POINTS_PER_CENTROID))
+        if nlist < 8:
+            print(f"⚠️ Only {n} chunks, too few to train IVF; using flat instead")
+            index_type = "flat"
+
+    params = {"index_type": index_type, "dimension": int(dimension), "ntotal": int(n)}
+    if index_type in ("ivf", "ivfpq"):
+        params["nlist"] = nlist
+        params["nprobe"] = min(nprobe or max(8, nlist // 8), nlist)
+    if index_type == "ivfpq":
+        # pq_m sub-quantizers must divide the dimension (384 -> 48 bytes per vector)
+        pq_m = pq_m or next(m for m in (48, 32, 24, 16, 8, 4, 2, 1) if dimension % m == 0)
+        params["pq_m"] = pq_m
+        params["pq_nbits"] = PQ_NBITS
+    if index_type == "hnsw":
+        params["hnsw_m"] = hnsw_m
+        params["ef_construction"] = ef_construction
+        params["ef_search"] = ef_search
+    return params
+
+
+def make_index(params):
+    # empty (untrained) index for the given index_meta params
+    dimension = params["dimension"]
+    index_type = params["index_type"]
+    if index_type == "flat":
+        index = faiss.IndexFlatL2(dimension)    #creates faiss index with L2(Euclidean distance)
+    elif index_type == "ivf":
+        index = faiss.IndexIVFFlat(faiss.IndexFlatL2(dimension), dimension, params["nlist"])
+    elif index_type == "ivfpq":
+        index = faiss.IndexIVFPQ(faiss.IndexFlatL2(dimension), dimension, params["nlist"],
+                                 params["pq_m"], params["pq_nbits"])
+    elif index_type == "hnsw":
+        index = faiss.IndexHNSWFlat(dimension, params["hnsw_m"])
+        index.hnsw.efConstruction = params["ef_construction"]
+    else:
+        raise ValueError(f"Unknown index type {index_type!r}, expected one of {INDEX_TYPES}")
+    return index
+
+
+def build_index(embeddings, params):
+    embeddings = np.ascontiguousarray(embeddings, dtype="float32")
+    index = make_index(params)
+    if not index.is_trained:
+        index.train(embeddings)
     index.add(embeddings)
+    set_search_params(index, params)
+    return index
+
+
+def _write_atomic(path, write):
+    tmp = path + ".tmp"
+    write(tmp)
+    os.replace(tmp, path)
+
+
+def _remove_files(index_path, names):
+    for name in names:
+        if os.path.exists(f"{index_path}/{name}"):
+            os.remove(f"{index_path}/{name}")
+
+
+def save_to_faiss(embeddings, chunks, index_path="embeddings/faiss_index", index_type="flat", metas=None, **index_options):
+    dimension = embeddings.shape[1]    #stores how many numbers in each vector
+    params = choose_index_params(len(embeddings), dimension, index_type, **index_options)
+    index = build_index(embeddings, params)
+    os.makedirs(index_path, exist_ok=True)
+
+    write_chunk_store(index_path, range(len(chunks)), chunks, metas)     #saves actual text chunks as an mmap-able blob + offsets
+
+    #a full build replaces any incremental state and the legacy pickle
+    _remove_files(index_path, ("manifest.json", "chunk_meta.json", "chunks.pkl"))
+
+    def dump_params(tmp):
+        with open(tmp, "w") as f:
+            json.dump(params, f, indent=2)    #index type and search params, read back by clinical_agent
+    _write_atomic(f"{index_path}/index_meta.json", dump_params)
+
+    #the index goes last, as in save_ingest_state: a running registry reloads when faiss.index changes
+    _write_atomic(f"{index_path}/faiss.index", lambda tmp: faiss.write_index(index, tmp))
+
+
+def chunk_id(source, page, occurrence, text):
+    # stable 63-bit id: unchanged chunks keep their vector across ingests, edited ones get a new id
+    digest = hashlib.sha1(f"{source}\0{page}\0{occurrence}\0{text}".encode("utf-8")).digest()
+    return int.from_bytes(digest[:8], "big") & 0x7FFFFFFFFFFFFFFF
+
+
+def file_sha1(path):
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def chunk_document(source, pages):
+    # [(chunk_id, text, [source, page, start, end])] for one document; chunks never cross a page
+    chunks = []
+    seen = {}
+    for page_no, chunk, start, end in iter_chunks(pages):
+        key = (page_no, chunk)
+        seen[key] = seen.get(key, -1) + 1
+        chunks.append((chunk_id(source, page_no, seen[key], chunk), chunk, [source, page_no, start, end]))
+    return chunks
+
+
+def import_build(index_path="embeddings/faiss_index"):
+    # Ingest state for an index written by 'process_pdf.py build' (no manifest): its vectors keep
+    # their ids 0..N-1 inside an IndexIDMap2, and the manifest records them under "build", which
+    # ingest never removes, so appending a corpus doesn't drop the chunks already there
+    index = faiss.read_index(f"{index_path}/faiss.index")
+    empty = faiss.clone_index(index)    # keeps the trained quantizer; cloned before the direct map, which blocks remove_ids
+    empty.reset()
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        ivf.make_direct_map()
+    vectors = index.reconstruct_n(0, index.ntotal)
+    wrapped = faiss.IndexIDMap2(empty)
+    wrapped.add_with_ids(vectors, np.arange(index.ntotal, dtype="int64"))
+
+    if has_chunk_store(index_path):
+        chunks, meta = read_chunk_store(index_path)
+    else:
+        with open(f"{index_path}/chunks.pkl", "rb") as f:
+            chunks = dict(enumerate(pickle.load(f)))
+        meta = {}
+    sources = sorted({m[0] for m in meta.values()})
+    print(f"📥 Importing {index.ntotal} chunks from the existing build ({', '.join(sources) or 'unknown source'})")
+    manifest = {"documents": {}, "build": {"sources": sources, "chunk_ids": list(chunks)}}
+    return wrapped, chunks, meta, manifest
+
+
+def load_ingest_state(index_path="embeddings/faiss_index"):
+    # (index, {id: text}, {id: [source, page, start, end]}, manifest); empty state if nothing was built or ingested yet
+    manifest_path = f"{index_path}/manifest.json"
+    if not os.path.exists(manifest_path):
+        if os.path.exists(f"{index_path}/faiss.index"):
+            return import_build(index_path)
+        return None, {}, {}, {"documents": {}}
+    with open(manifest_path) as f:
+        manifest = json.load(f)
+    index = faiss.read_index(f"{index_path}/faiss.index")
+    if has_chunk_store(index_path):
+        chunks, meta = read_chunk_store(index_path)
+    else:
+        # state written before the chunk store existed
+        with open(f"{index_path}/chunks.pkl", "rb") as f:
+            chunks = pickle.load(f)
+        with open(f"{index_path}/chunk_meta.json") as f:
+            meta = {int(k): (v + [-1, -1])[:4] for k, v in json.load(f).items()}
+    return index, chunks, meta, manifest
+
+
+def save_ingest_state(index, chunks, meta, manifest, params, index_path="embeddings/faiss_index"):
     os.makedirs(index_path, exist_ok=True)
+    params = dict(params, ntotal=int(index.ntotal))
+
+    def dump_json(obj):
+        def write(tmp):
+            with open(tmp, "w") as f:
+                json.dump(obj, f)
+        return write
+
+    # the index goes last: the clinical agent reloads when faiss.index changes
+    ids = list(chunks)
+    write_chunk_store(index_path, ids, [chunks[cid] for cid in ids], [meta.get(cid) for cid in ids])
+    _remove_files(index_path, ("chunks.pkl", "chunk_meta.json"))
+    _write_atomic(f"{index_path}/manifest.json", dump_json(manifest))
+    _write_atomic(f"{index_path}/index_meta.json", dump_json(params))
+    _write_atomic(f"{index_path}/faiss.index", lambda tmp: faiss.write_index(index, tmp))
+
+
+def ingest_directory(corpus_dir, index_path="embeddings/faiss_index", index_type="flat", workers=None):
+    # Re-embeds only chunks of new/changed PDFs and drops the vectors of deleted ones
+    index, chunks, meta, manifest = load_ingest_state(index_path)
+    documents = manifest["documents"]
+
+    on_disk = {}
+    for root, _, files in os.walk(corpus_dir):
+        for name in files:
+            if name.lower().endswith(".pdf"):
+                path = os.path.join(root, name)
+                on_disk[os.path.relpath(path, corpus_dir)] = path
 
-    faiss.write_index(index, f"{index_path}/faiss.index")    #saves faiss indexto a file
+    stale_ids = []
+    new_chunks = []
+    for source in sorted(set(documents) - set(on_disk)):
+        print(f"🗑️ Removing {source}")
+        stale_ids.extend(documents.pop(source)["chunk_ids"])
 
-    with open(f"{index_path}/chunks.pkl", "wb") as f:
-        pickle.dump(chunks, f)     #saves actual text chunks into .pkl file
+    for source, path in sorted(on_disk.items()):
+        digest = file_sha1(path)
+        previous = documents.get(source)
+        if previous and previous["sha1"] == digest:
+            continue
+        doc_chunks = chunk_document(source, iter_pdf_pages(path, workers))
+        doc_ids = [cid for cid, _, _ in doc_chunks]
+        old_ids = set(previous["chunk_ids"]) if previous else set()
+        stale_ids.extend(old_ids - set(doc_ids))
+        fresh = [chunk for chunk in doc_chunks if chunk[0] not in old_ids]
+        print(f"📄 {source}: {len(fresh)} new/changed of {len(doc_chunks)} chunks")
+        new_chunks.extend(fresh)
+        documents[source] = {"sha1": digest, "chunk_ids": doc_ids}
+
+    stale_ids = sorted(set(stale_ids))
+    if not stale_ids and not new_chunks:
+        print("✅ Index already up to date")
+        return index
+
+    embeddings = None
+    if new_chunks:
+        embeddings = np.vstack([e for _, e in iter_embeddings(text for _, text, _ in new_chunks)]).astype("float32")
+    if index is None:
+        if embeddings is None:
+            raise ValueError(f"No PDF documents found in {corpus_dir}")
+        params = choose_index_params(len(embeddings), embeddings.shape[1], index_type)
+        index = faiss.IndexIDMap2(make_index(params))
+        if not index.is_trained:
+            index.train(np.ascontiguousarray(embeddings, dtype="float32"))
+    else:
+        params = load_index_meta(index_path)
+
+    if stale_ids:
+        if params["index_type"] == "hnsw":
+            raise ValueError("HNSW indexes cannot remove vectors; rebuild with 'process_pdf.py build'")
+        index.remove_ids(np.array(stale_ids, dtype="int64"))
+        for cid in stale_ids:
+            chunks.pop(cid, None)
+            meta.pop(cid, None)
+
+    if new_chunks:
+        ids = np.array([cid for cid, _, _ in new_chunks], dtype="int64")
+        index.add_with_ids(np.ascontiguousarray(embeddings, dtype="float32"), ids)
+        for cid, text, chunk_meta in new_chunks:
+            chunks[cid] = text
+            meta[cid] = chunk_meta
+
+    set_search_params(index, params)
+    save_ingest_state(index, chunks, meta, manifest, params, index_path)
+    print(f"✅ Added {len(new_chunks)} chunks, removed {len(stale_ids)}, index now holds {index.ntotal}")
+    return index
+
+
+def _time_search(index, queries, k):
+    start = time.perf_counter()
+    _, I = index.search(queries, k)
+    return I, (time.perf_counter() - start) * 1000 / len(queries)
+
+
+def recall_latency_report(embeddings, k=5, n_queries=200, index_types=("ivf", "hnsw", "ivfpq"), seed=0):
+    # Recall@k of each ANN index against the exact flat baseline, plus mean latency per query
+    embeddings = np.ascontiguousarray(embeddings, dtype="float32")
+    rng = np.random.default_rng(seed)
+    pick = rng.choice(len(embeddings), size=min(n_queries, len(embeddings)), replace=False)
+    noise = rng.normal(scale=0.01, size=(len(pick), embeddings.shape[1])).astype("float32")
+    queries = embeddings[pick] + noise
+
+    flat = build_index(embeddings, choose_index_params(len(embeddings), embeddings.shape[1], "flat"))
+    truth, flat_ms = _time_search(flat, queries, k)
+    rows = [{"index_type": "flat", "recall": 1.0, "ms_per_query": flat_ms}]
+
+    for index_type in index_types:
+        params = choose_index_params(len(embeddings), embeddings.shape[1], index_type)
+        if params["index_type"] != index_type:
+            continue
+        index = build_index(embeddings, params)
+        if "nprobe" in params:
+            knob, values = "nprobe", sorted({v for v in (1, 2, 4, 8, 16, 32, 64, params["nprobe"]) if v <= params["nlist"]})
+        else:
+            knob, values = "efSearch", [16, 32, 64, 128, 256]
+        for value in values:
+            faiss.ParameterSpace().set_index_parameter(index, knob, value)
+            found, ms = _time_search(index, queries, k)
+            recall = np.mean([len(set(f) & set(t)) / k for f, t in zip(found, truth)])
+            rows.append({"index_type": index_type, knob: value, "recall": float(recall), "ms_per_query": ms})
+    return rows
+
+
+def print_report(rows):
+    print(f"{'index':<8}{'param':<14}{'recall@k':>10}{'ms/query':>12}")
+    for row in rows:
+        param = next((f"{k}={row[k]}" for k in ("nprobe", "efSearch") if k in row), "-")
+        print(f"{row['index_type']:<8}{param:<14}{row['recall']:>10.3f}{row['ms_per_query']:>12.4f}")
+
+
+def load_index_vectors(index_path="embeddings/faiss_index"):
+    # Flat indexes store the raw vectors; anything lossy gets re-embedded from the chunks
+    index = faiss.read_index(f"{index_path}/faiss.index")
+    if isinstance(index, (faiss.IndexIDMap, faiss.IndexIDMap2)):
+        index = faiss.downcast_index(index.index)
+    if isinstance(index, faiss.IndexFlat):
+        return index.reconstruct_n(0, index.ntotal)
+    chunks = load_chunks(index_path)
+    return create_embeddings(list(chunks.values()) if isinstance(chunks, Mapping) else chunks)
 
 
 if __name__ == "__main__":
-    pdf_text = extract_pdf_text("nephrology.pdf")
-    chunks = split_text_into_chunks(pdf_text)
-    embeddings = create_embeddings(chunks)
-    save_to_faiss(embeddings, chunks)
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Build the FAISS index used by the clinical agent")
+    sub = parser.add_subparsers(dest="command")
+
+    build = sub.add_parser("build", help="chunk and embed a PDF into a fresh index (default)")
+    build.add_argument("pdf", nargs="?", default="nephrology.pdf")
+    build.add_argument("--index-type", choices=INDEX_TYPES, default="flat")
+    build.add_argument("--nlist", type=int)
+    build.add_argument("--nprobe", type=int)
+    build.add_argument("--ef-search", type=int, default=64)
+    build.add_argument("--workers", type=int, help="PDF extraction processes (default: all cores)")
+
+    ingest = sub.add_parser("ingest", help="incrementally add/update/remove every PDF under a directory")
+    ingest.add_argument("corpus_dir")
+    ingest.add_argument("--index-type", choices=INDEX_TYPES, default="flat", help="used only for a new index")
+    ingest.add_argument("--workers", type=int, help="PDF extraction processes (default: all cores)")
+
+    report = sub.add_parser("report", help="recall vs latency of each index type against flat")
+    report.add_argument("--k", type=int, default=5)
+    report.add_argument("--queries", type=int, default=200)
+
+    args = parser.parse_args()
+
+    if args.command == "ingest":
+        ingest_directory(args.corpus_dir, index_type=args.index_type, workers=args.workers)
+    elif args.command == "report":
+        rows = recall_latency_report(load_index_vectors(), k=args.k, n_queries=args.queries)
+        print_report(rows)
+        with open("embeddings/faiss_index/index_report.json", "w") as f:
+            json.dump(rows, f, indent=2)
+    else:
+        pdf_path = getattr(args, "pdf", "nephrology.pdf")
+        options, workers = {}, None
+        if args.command == "build":
+            options = {"nlist": args.nlist, "nprobe": args.nprobe, "ef_search": args.ef_search}
+            workers = args.workers
+        chunks, metas, embeddings = embed_pdf(pdf_path, workers)
+        save_to_faiss(embeddings, chunks, index_type=getattr(args, "index_type", "flat"), metas=metas, **options)
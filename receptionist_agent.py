@@ -1,50 +1,35 @@
-from patient_lookup import load_patient_data, find_patient_by_name
+from patient_lookup import PatientIndex
+from patient_store import load_patient_records, default_patient_path
+from service_client import get_service_client
+from dialogue import GREETING_MSG, DialogueEngine, DialogueState, Session, get_questions, patient_lookup
+from intent_router import is_medical_query
 import random
 
 def generate_followup_instructions(report):
-    return [
-        f"Are u taking your medications as prescribed: {', '.join(report['medications'])}?",
-        f"Are u following your dietary restrictions: {report['dietary_restrictions']}?",
-        f"Have u noticed any warning signs like {report['warning_signs']}?",
-        f"Have u scheduled your follow-up: {report['follow_up']}?"
-    ]
+    return list(get_questions(report))
 
-def is_medical_query(user_input):
-    medical_keywords = ["pain", "swelling", "urine", "dizzy", "blood", "symptoms", "medicine", "medication", "side effects"]
-    return any(word in user_input.lower() for word in medical_keywords)
+def ask_clinical_agent(question, service=None, report=None):
+    if service:
+        return service.ask(question, report=report)
+    from clinical_agent import run_clinical_agent
+    return run_clinical_agent(question, report)
 
 def run_receptionist():
-    data = load_patient_data("patient_reports.json")
-
-    print("Receptionist Agent: Hello! I'm your AI care assistant. What's your name?")
-    name = input("You: ")
-
-    result = find_patient_by_name(name, data)
-
-    if isinstance(result, str):
-        print(f"Receptionist Agent: {result}")
-        return
-    
-    if isinstance(result, list):
-        print("Multiple patients found. Please be more specfic.")
-        return
-    
-    report = result
-
-    print(f"\nReceptionist Agent: Hi {report['patient_name']}! i found your discharge report.")
-    print(f"Diagnosis: {report['primary_diagnosis']}")
-    print("Let me ask u few questions about your recovery:\n")
-
-    questions = generate_followup_instructions(report)
-    for q in questions:
-        print(q)
-        answer = input("You: ")
-
-        if is_medical_query(answer):
-            print("Following your concern to our Clinical AI Agent....\n")
-            return answer
-        
-        print("\nThank you for checking in! You seem to be on the right track.")
+    service = get_service_client()
+    data = None if service else PatientIndex(load_patient_records(default_patient_path()))
+    engine = DialogueEngine(patient_lookup(service, data), is_medical_query)
+    session = Session()
+
+    # Same flow as the Streamlit app: name lookup, follow-up questions, clinical hand-off
+    print(f"Receptionist Agent: {GREETING_MSG}")
+    while session.state != DialogueState.DONE:
+        turn = engine.step(session, input("You: "))
+        for role, msg in turn.messages:
+            print(f"{'Receptionist' if role == 'receptionist' else 'Clinical'} Agent: {msg}")
+        if turn.clinical_question:
+            answer, source = ask_clinical_agent(turn.clinical_question, service, session.report)
+            print(f"Clinical Agent: {answer}\n({source})")
+    return session
 
 if __name__ == "__main__":
-    run_receptionist()
\ No newline at end of file
+    run_receptionist()
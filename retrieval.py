@@ -0,0 +1,163 @@
+import math
+import os
+import re
+import threading
+from collections import defaultdict
+from collections.abc import Mapping
+import numpy as np
+from metrics import annotate, stage
+
+RRF_K = 60
+VECTOR_CANDIDATES = 20
+# a chunk between threshold and this L2 distance still qualifies if BM25 also ranks it
+RELAXED_THRESHOLD = 1.0
+BM25_CANDIDATES = 20
+RERANK_ENABLED = os.environ.get("MEDAI_RERANK", "0") == "1"
+RERANK_MODEL_NAME = "cross-encoder/ms-marco-MiniLM-L-6-v2"
+RERANK_TOP_N = 10
+MIN_MERGE_OVERLAP = 20    # split_text_into_chunks overlaps neighbours by up to 50 chars
+MAX_MERGE_OVERLAP = 100
+
+_TOKEN = re.compile(r"\w+", re.UNICODE)
+_STOPWORDS = frozenset("""a an and are as at be but by can do does for from has have how i if in is it its
+my me of on or so that the their there these this to was what when where which who why will with you your""".split())
+
+
+def tokenize(text):
+    return [t for t in _TOKEN.findall(text.casefold()) if t not in _STOPWORDS]
+
+
+def chunk_keys(chunks):
+    # FAISS ids for the chunk container: positions for a list, ids for a ChunkStore / {id: text}
+    return list(chunks.keys()) if isinstance(chunks, Mapping) else list(range(len(chunks)))
+
+
+class BM25Index:
+    # In-memory inverted index over the chunks; postings are NumPy arrays so a query
+    # touches only the documents that contain its terms.
+    def __init__(self, chunks, k1=1.5, b=0.75):
+        self.keys = chunk_keys(chunks)
+        texts = chunks.values() if isinstance(chunks, Mapping) else chunks
+        postings = defaultdict(lambda: ([], []))
+        lengths = []
+        for doc, text in enumerate(texts):
+            counts = defaultdict(int)
+            for token in tokenize(text):
+                counts[token] += 1
+            lengths.append(sum(counts.values()))
+            for token, tf in counts.items():
+                docs, tfs = postings[token]
+                docs.append(doc)
+                tfs.append(tf)
+
+        n = len(lengths)
+        self.doc_len = np.asarray(lengths, dtype="float32")
+        avg_len = float(self.doc_len.mean()) if n else 0.0
+        self.norm = k1 * (1 - b + b * self.doc_len / (avg_len or 1.0))
+        self.k1 = k1
+        self.postings = {}
+        for token, (docs, tfs) in postings.items():
+            idf = math.log(1 + (n - len(docs) + 0.5) / (len(docs) + 0.5))
+            self.postings[token] = (np.asarray(docs, dtype="int64"), np.asarray(tfs, dtype="float32"), idf)
+
+    def search(self, query, top_n=BM25_CANDIDATES):
+        # [(chunk key, score)] best first
+        scores = np.zeros(len(self.keys), dtype="float32")
+        for token in set(tokenize(query)):
+            if token in self.postings:
+                docs, tfs, idf = self.postings[token]
+                scores[docs] += idf * tfs * (self.k1 + 1) / (tfs + self.norm[docs])
+        hits = np.flatnonzero(scores)
+        if not len(hits):
+            return []
+        top = hits[np.argsort(-scores[hits])[:top_n]]
+        return [(self.keys[i], float(scores[i])) for i in top]
+
+
+def rrf_fuse(rankings, k=RRF_K):
+    # reciprocal-rank fusion of several best-first key lists
+    fused = defaultdict(float)
+    for ranking in rankings:
+        for rank, key in enumerate(ranking):
+            fused[key] += 1.0 / (k + rank + 1)
+    return sorted(fused, key=fused.get, reverse=True)
+
+
+def _overlap(a, b):
+    # length of the longest suffix of a that is a prefix of b
+    for size in range(min(len(a) - 1, len(b) - 1, MAX_MERGE_OVERLAP), MIN_MERGE_OVERLAP - 1, -1):
+        if a.endswith(b[:size]):
+            return size
+    return 0
+
+
+def dedupe_chunks(texts):
+    # Drops repeated/contained chunks and stitches neighbours that share the splitter overlap,
+    # so the LLM never sees the same sentence twice. Keeps the order of first appearance.
+    merged = []
+    for text in texts:
+        if any(text in kept for kept in merged):
+            continue
+        for i, kept in enumerate(merged):
+            if _overlap(kept, text):
+                merged[i] = kept + text[_overlap(kept, text):]
+                break
+            if _overlap(text, kept):
+                merged[i] = text + kept[_overlap(text, kept):]
+                break
+        else:
+            merged.append(text)
+    return merged
+
+
+_reranker = None
+_reranker_lock = threading.Lock()
+
+
+def get_reranker():
+    global _reranker
+    if _reranker is None:
+        with _reranker_lock:
+            if _reranker is None:
+                from sentence_transformers import CrossEncoder
+                _reranker = CrossEncoder(RERANK_MODEL_NAME, device="cpu")
+    return _reranker
+
+
+def rerank(question, texts, top_n=RERANK_TOP_N):
+    # CPU cross-encoder over the first top_n candidates; the rest keep their fused order
+    head, tail = texts[:top_n], texts[top_n:]
+    if len(head) < 2:
+        return texts
+    scores = get_reranker().predict([(question, t) for t in head])
+    return [head[i] for i in np.argsort(-np.asarray(scores))] + tail
+
+
+def hybrid_search(question, question_embedding, index, chunks, bm25, top_k=5, threshold=0.8,
+                  use_rerank=RERANK_ENABLED):
+    with stage("faiss_search"):
+        D, I = index.search(np.asarray([question_embedding], dtype="float32"), VECTOR_CANDIDATES)
+    with stage("bm25"):
+        lexical = [key for key, _ in bm25.search(question)]
+    lexical_set = set(lexical)
+    annotate(faiss_distances=[round(float(d), 4) for d, key in zip(D[0][:5], I[0][:5]) if key >= 0])
+
+    vector = []
+    for distance, key in zip(D[0], I[0]):
+        if key < 0:
+            continue
+        # strict threshold on its own, relaxed when BM25 agrees the chunk is on topic
+        if distance < threshold or (distance < RELAXED_THRESHOLD and key in lexical_set):
+            vector.append(int(key))
+    annotate(vector_hits=len(vector), bm25_hits=len(lexical))
+    if not vector:
+        return []
+
+    qualified = set(vector)
+    ranked = [key for key in rrf_fuse([vector, lexical]) if key in qualified]
+    with stage("chunk_fetch"):
+        texts = [chunks[key] for key in ranked]
+    if use_rerank:
+        with stage("rerank"):
+            texts = rerank(question, texts)
+    return dedupe_chunks(texts[:top_k])
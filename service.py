@@ -0,0 +1,192 @@
+import argparse
+import asyncio
+import json
+import logging
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI, HTTPException
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from pydantic import BaseModel
+
+from metrics import metrics, setup_logging
+
+# before clinical_agent is imported: its setup_logging("clinical_agent.log") would claim the root logger
+setup_logging("medai_service.log", fmt="%(asctime)s - %(process)d - %(levelname)s - %(message)s")
+
+from clinical_agent import run_clinical_agent, stream_clinical_agent
+from dialogue import DialogueEngine, Session, patient_lookup
+from model_registry import warm_up
+from patient_lookup import PatientIndex, find_patient_by_name
+from patient_store import default_patient_path, load_patient_records
+from intent_router import is_medical_query
+from session_store import SessionStore
+
+SESSION_PURGE_SECONDS = 3600
+
+# Per worker process: one encoder/index (via the registry), one patient index, one session store handle
+patients = None
+sessions = None
+engine = None
+
+
+@asynccontextmanager
+async def lifespan(app):
+    global patients, sessions, engine
+    await asyncio.to_thread(warm_up)
+    patients = await asyncio.to_thread(lambda: PatientIndex(load_patient_records(default_patient_path())))
+    sessions = SessionStore()
+    engine = DialogueEngine(patient_lookup(patients=patients), is_medical_query)
+    logging.info(f"Worker ready with {len(patients)} patients")
+    purger = asyncio.create_task(purge_sessions())
+    yield
+    purger.cancel()
+
+
+async def purge_sessions(interval=SESSION_PURGE_SECONDS):
+    # load() already skips expired sessions; this deletes their rows so sessions.sqlite stays small
+    while True:
+        await asyncio.to_thread(sessions.purge_expired)
+        await asyncio.sleep(interval)
+
+
+app = FastAPI(title="MedAI Assistant service", lifespan=lifespan)
+
+
+class LookupRequest(BaseModel):
+    name: str
+
+
+class MessageRequest(BaseModel):
+    text: str
+
+
+class QuestionRequest(BaseModel):
+    question: str
+    session_id: str | None = None
+    report: dict | None = None    # discharge report for the prompt; defaults to the session's patient
+
+
+def _session_report(req):
+    if req.report is not None or req.session_id is None:
+        return req.report
+    state = sessions.load(req.session_id) or {}
+    return (state.get("dialogue") or {}).get("r")
+
+
+def _record_exchange(session_id, question, answer, source):
+    if session_id is None:
+        return
+    state = sessions.load(session_id)
+    if state is None:
+        return
+    state.setdefault("clinical_history", []).append({"question": question, "answer": answer, "source": source})
+    sessions.save(session_id, state)
+
+
+@app.get("/health")
+async def health():
+    return {"status": "ok", "patients": len(patients)}
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def prometheus_metrics():
+    # this worker's stage histograms; the JSONL sink (python metrics.py) covers all workers
+    return metrics.render_prometheus()
+
+
+@app.post("/patients/lookup")
+async def lookup_patient(req: LookupRequest):
+    # same contract as find_patient_by_name, tagged so clients don't have to sniff types
+    result = find_patient_by_name(req.name, patients)
+    if isinstance(result, str):
+        return {"status": "not_found", "message": result, "suggestions": patients.fuzzy_search(req.name)}
+    if isinstance(result, list):
+        return {"status": "multiple", "matches": result}
+    return {"status": "found", "report": result}
+
+
+@app.post("/clinical/ask")
+async def ask(req: QuestionRequest):
+    # the agent blocks on embedding/FAISS/LLM, so it runs on a thread and the loop keeps serving
+    report = await asyncio.to_thread(_session_report, req)
+    answer, source = await asyncio.to_thread(run_clinical_agent, req.question, report)
+    await asyncio.to_thread(_record_exchange, req.session_id, req.question, answer, source)
+    return {"answer": answer, "source": source}
+
+
+@app.post("/clinical/stream")
+async def ask_stream(req: QuestionRequest):
+    # NDJSON: {"piece": ...} lines while the LLM writes, then one {"source": ...} line
+    report = await asyncio.to_thread(_session_report, req)
+    stream = await asyncio.to_thread(stream_clinical_agent, req.question, report)
+    pieces = iter(stream)
+    done = object()
+
+    async def body():
+        while (piece := await asyncio.to_thread(next, pieces, done)) is not done:
+            yield json.dumps({"piece": piece}) + "\n"
+        await asyncio.to_thread(_record_exchange, req.session_id, req.question, stream.text, stream.source)
+        yield json.dumps({"source": stream.source}) + "\n"
+
+    return StreamingResponse(body(), media_type="application/x-ndjson")
+
+
+@app.post("/sessions")
+async def create_session():
+    return {"session_id": await asyncio.to_thread(sessions.create)}
+
+
+@app.get("/sessions/{session_id}")
+async def get_session(session_id: str):
+    state = await asyncio.to_thread(sessions.load, session_id)
+    if state is None:
+        raise HTTPException(status_code=404, detail="Unknown or expired session")
+    return state
+
+
+@app.put("/sessions/{session_id}")
+async def put_session(session_id: str, state: dict):
+    await asyncio.to_thread(sessions.save, session_id, state)
+    return {"session_id": session_id}
+
+
+def _dialogue_turn(session_id, text):
+    state = sessions.load(session_id)
+    if state is None:
+        return None
+    session = Session.restore(state.get("dialogue"))
+    turn = engine.step(session, text)
+    messages = [{"role": role, "text": msg} for role, msg in turn.messages]
+    if turn.clinical_question:
+        answer, source = run_clinical_agent(turn.clinical_question, session.report)
+        messages += [{"role": "clinical", "text": answer}, {"role": "source", "text": source}]
+        state.setdefault("clinical_history", []).append({"question": turn.clinical_question, "answer": answer, "source": source})
+    state["dialogue"] = session.snapshot()
+    sessions.save(session_id, state)
+    return {"state": session.state.name.lower(), "messages": messages}
+
+
+@app.post("/sessions/{session_id}/messages")
+async def post_message(session_id: str, req: MessageRequest):
+    # one receptionist/clinical turn; the dialogue lives in the session store between requests
+    result = await asyncio.to_thread(_dialogue_turn, session_id, req.text)
+    if result is None:
+        raise HTTPException(status_code=404, detail="Unknown or expired session")
+    return result
+
+
+@app.delete("/sessions/{session_id}")
+async def delete_session(session_id: str):
+    await asyncio.to_thread(sessions.delete, session_id)
+    return {"session_id": session_id}
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Serve the receptionist and clinical agents over HTTP")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=2, help="worker processes, each with its own models")
+    args = parser.parse_args()
+    uvicorn.run("service:app", host=args.host, port=args.port, workers=args.workers)
@@ -0,0 +1,61 @@
+import json
+import os
+import requests
+from requests.adapters import HTTPAdapter
+
+SERVICE_URL = os.environ.get("MEDAI_SERVICE_URL")    # e.g. http://127.0.0.1:8000; unset = run agents in-process
+CONNECT_TIMEOUT = 3.05
+READ_TIMEOUT = 120
+
+
+class RemoteStream:
+    # Same shape as clinical_agent.ClinicalStream: iterate for pieces, .source is final afterwards
+    def __init__(self, response):
+        self._response = response
+        self.source = None
+        self.text = ""
+
+    def __iter__(self):
+        with self._response:
+            for line in self._response.iter_lines(decode_unicode=True):
+                if not line:
+                    continue
+                event = json.loads(line)
+                if "piece" in event:
+                    self.text += event["piece"]
+                    yield event["piece"]
+                else:
+                    self.source = event.get("source")
+
+
+class ServiceClient:
+    # Thin HTTP client for service.py, so front-ends load no models themselves
+    def __init__(self, base_url=SERVICE_URL, timeout=(CONNECT_TIMEOUT, READ_TIMEOUT)):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.http = requests.Session()
+        self.http.mount("http://", HTTPAdapter(pool_maxsize=16))
+        self.http.mount("https://", HTTPAdapter(pool_maxsize=16))
+
+    def _post(self, path, payload=None, **kwargs):
+        response = self.http.post(f"{self.base_url}{path}", json=payload, timeout=self.timeout, **kwargs)
+        response.raise_for_status()
+        return response
+
+    def lookup(self, name):
+        return self._post("/patients/lookup", {"name": name}).json()
+
+    def ask(self, question, session_id=None, report=None):
+        result = self._post("/clinical/ask", {"question": question, "session_id": session_id, "report": report}).json()
+        return result["answer"], result["source"]
+
+    def stream(self, question, session_id=None, report=None):
+        payload = {"question": question, "session_id": session_id, "report": report}
+        return RemoteStream(self._post("/clinical/stream", payload, stream=True))
+
+    def create_session(self):
+        return self._post("/sessions").json()["session_id"]
+
+
+def get_service_client():
+    return ServiceClient() if SERVICE_URL else None
@@ -0,0 +1,50 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+SESSION_DB_PATH = "embeddings/sessions.sqlite"
+SESSION_TTL_SECONDS = 24 * 3600
+
+
+class SessionStore:
+    # JSON session state keyed by session id. SQLite in WAL mode so every service worker
+    # process sees the same sessions, whichever worker a request lands on.
+    def __init__(self, path=SESSION_DB_PATH, ttl_seconds=SESSION_TTL_SECONDS):
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False, timeout=10)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("CREATE TABLE IF NOT EXISTS sessions (id TEXT PRIMARY KEY, state TEXT NOT NULL, updated_at REAL NOT NULL)")
+        self._db.commit()
+
+    def create(self, state=None):
+        session_id = uuid.uuid4().hex
+        self.save(session_id, state or {})
+        return session_id
+
+    def load(self, session_id):
+        with self._lock:
+            row = self._db.execute("SELECT state FROM sessions WHERE id = ? AND updated_at >= ?",
+                                   (session_id, time.time() - self.ttl_seconds)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def save(self, session_id, state):
+        with self._lock:
+            self._db.execute("INSERT OR REPLACE INTO sessions VALUES (?, ?, ?)",
+                             (session_id, json.dumps(state, separators=(",", ":")), time.time()))
+            self._db.commit()
+
+    def delete(self, session_id):
+        with self._lock:
+            self._db.execute("DELETE FROM sessions WHERE id = ?", (session_id,))
+            self._db.commit()
+
+    def purge_expired(self):
+        with self._lock:
+            self._db.execute("DELETE FROM sessions WHERE updated_at < ?", (time.time() - self.ttl_seconds,))
+            self._db.commit()
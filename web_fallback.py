@@ -0,0 +1,248 @@
+import argparse
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import faiss
+import numpy as np
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from metrics import annotate, stage
+
+NO_RESULT = "No relevant information found on the web."
+TAVILY_BASE_URL = os.environ.get("TAVILY_BASE_URL", "https://api.tavily.com")
+TAVILY_API_KEY = os.environ.get("TAVILY_API_KEY", "")
+WEB_PROVIDER = os.environ.get("MEDAI_WEB_PROVIDER", "tavily")    # tavily | fixture
+WEB_FIXTURE_PATH = os.environ.get("MEDAI_WEB_FIXTURE", "web_fixture.json")
+WEB_CACHE_PATH = "embeddings/web_cache.sqlite"
+LEARNED_INDEX_DIR = "embeddings/learned_index"
+CACHE_TTL_SECONDS = 3 * 24 * 3600
+LEARNED_THRESHOLD = 0.5    # L2 distance; tighter than the PDF threshold, we only reuse near-duplicates
+CONNECT_TIMEOUT = 3.05
+READ_TIMEOUT = 10
+
+
+def normalize_query(query):
+    return re.sub(r"\s+", " ", re.sub(r"[^\w\s]", " ", query.casefold())).strip()
+
+
+class TavilyProvider:
+    # Pooled keep-alive session; base_url can point at the local stand-in server below
+    name = "tavily"
+
+    def __init__(self, api_key=TAVILY_API_KEY, base_url=TAVILY_BASE_URL, timeout=(CONNECT_TIMEOUT, READ_TIMEOUT)):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.api_key = api_key
+        self.session = requests.Session()
+        self.session.headers["Authorization"] = f"Bearer {api_key}"
+        retries = Retry(total=2, backoff_factor=0.3, status_forcelist=(429, 502, 503, 504), allowed_methods=None)
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=16, max_retries=retries)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def search(self, query):
+        if not self.api_key:
+            logging.warning("TAVILY_API_KEY is not set; skipping web search")
+            return None
+        try:
+            response = self.session.post(f"{self.base_url}/search", json={"query": query, "search_depth": "basic"},
+                                         timeout=self.timeout)
+        except requests.RequestException as e:
+            logging.warning(f"Web search failed: {e}")
+            return None
+        if response.status_code != 200:
+            return None
+        try:
+            results = response.json().get("results") or []
+        except ValueError as e:
+            logging.warning(f"Web search returned invalid JSON: {e}")
+            return None
+        return results[0]["content"] if results else None
+
+
+class FixtureProvider:
+    # Offline provider: answers from a JSON file of {normalized query: content}
+    name = "fixture"
+
+    def __init__(self, path=WEB_FIXTURE_PATH, default=None):
+        self.answers = {}
+        if os.path.exists(path):
+            with open(path) as f:
+                self.answers = {normalize_query(k): v for k, v in json.load(f).items()}
+        self.default = default
+
+    def search(self, query):
+        return self.answers.get(normalize_query(query), self.default)
+
+
+class WebCache:
+    # Provider responses keyed by normalized query, expiring after ttl_seconds
+    def __init__(self, path=WEB_CACHE_PATH, ttl_seconds=CACHE_TTL_SECONDS):
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("CREATE TABLE IF NOT EXISTS responses (query TEXT PRIMARY KEY, content TEXT NOT NULL, created_at REAL NOT NULL)")
+        self._db.commit()
+
+    def get(self, query):
+        with self._lock:
+            row = self._db.execute("SELECT content FROM responses WHERE query = ? AND created_at >= ?",
+                                   (normalize_query(query), time.time() - self.ttl_seconds)).fetchone()
+        return row[0] if row else None
+
+    def put(self, query, content):
+        with self._lock:
+            self._db.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?)", (normalize_query(query), content, time.time()))
+            self._db.execute("DELETE FROM responses WHERE created_at < ?", (time.time() - self.ttl_seconds,))
+            self._db.commit()
+
+
+class LearnedShard:
+    # Small FAISS shard of questions that previously needed the web, with their answers.
+    # A close enough repeat is answered locally without touching the provider.
+    def __init__(self, index_dir=LEARNED_INDEX_DIR, threshold=LEARNED_THRESHOLD):
+        self.index_dir = index_dir
+        self.threshold = threshold
+        self._lock = threading.Lock()
+        self.index = None
+        self.answers = []
+        if os.path.exists(f"{index_dir}/faiss.index"):
+            self.index = faiss.read_index(f"{index_dir}/faiss.index")
+            with open(f"{index_dir}/answers.json") as f:
+                self.answers = json.load(f)
+
+    def search(self, embedding):
+        with self._lock:
+            if self.index is None or self.index.ntotal == 0:
+                return None
+            D, I = self.index.search(np.asarray([embedding], dtype="float32"), 1)
+            if I[0][0] >= 0 and D[0][0] < self.threshold:
+                return self.answers[I[0][0]]["answer"]
+        return None
+
+    def add(self, embedding, question, answer):
+        embedding = np.asarray([embedding], dtype="float32")
+        with self._lock:
+            if self.index is None:
+                self.index = faiss.IndexFlatL2(embedding.shape[1])
+            self.index.add(embedding)
+            self.answers.append({"question": question, "answer": answer})
+            os.makedirs(self.index_dir, exist_ok=True)
+            with open(f"{self.index_dir}/answers.json.tmp", "w") as f:
+                json.dump(self.answers, f)
+            os.replace(f"{self.index_dir}/answers.json.tmp", f"{self.index_dir}/answers.json")
+            faiss.write_index(self.index, f"{self.index_dir}/faiss.index.tmp")
+            os.replace(f"{self.index_dir}/faiss.index.tmp", f"{self.index_dir}/faiss.index")
+
+
+class WebFallback:
+    # learned shard -> response cache -> provider; web answers are written back to both
+    def __init__(self, provider, cache=None, learned=None):
+        self.provider = provider
+        self.cache = cache
+        self.learned = learned
+        self.counts = {"learned": 0, "cache": 0, "web": 0, "none": 0}
+
+    def _served(self, tier):
+        self.counts[tier] += 1
+        annotate(web_tier=tier)
+
+    def search(self, query, embedding=None):
+        if embedding is not None and self.learned is not None:
+            answer = self.learned.search(embedding)
+            if answer is not None:
+                self._served("learned")
+                return answer
+
+        answer = self.cache.get(query) if self.cache is not None else None
+        if answer is not None:
+            self._served("cache")
+        else:
+            with stage("web_provider"):
+                answer = self.provider.search(query)
+            if answer is None:
+                self._served("none")
+                return NO_RESULT
+            self._served("web")
+            if self.cache is not None:
+                self.cache.put(query, answer)
+
+        if embedding is not None and self.learned is not None:
+            self.learned.add(embedding, query, answer)
+        return answer
+
+
+def make_provider(name=WEB_PROVIDER):
+    if name == "tavily":
+        return TavilyProvider()
+    if name == "fixture":
+        return FixtureProvider()
+    raise ValueError(f"Unknown web provider {name!r}, expected 'tavily' or 'fixture'")
+
+
+_fallback = None
+_fallback_lock = threading.Lock()
+
+
+def get_web_fallback():
+    global _fallback
+    if _fallback is None:
+        with _fallback_lock:
+            if _fallback is None:
+                _fallback = WebFallback(make_provider(), WebCache(), LearnedShard())
+    return _fallback
+
+
+def set_web_fallback(fallback):
+    # lets tests/benchmarks swap in e.g. WebFallback(FixtureProvider(default="..."))
+    global _fallback
+    _fallback = fallback
+
+
+def make_stand_in_handler(provider):
+    # Tavily-compatible POST /search answered from a local provider, for offline runs/benchmarks
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            if self.path != "/search":
+                self.send_error(404)
+                return
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            content = provider.search(body.get("query", ""))
+            payload = json.dumps({"results": [{"content": content}] if content else []}).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+def serve_stand_in(provider, host="127.0.0.1", port=8765):
+    server = ThreadingHTTPServer((host, port), make_stand_in_handler(provider))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local Tavily stand-in: TAVILY_BASE_URL=http://127.0.0.1:8765")
+    parser.add_argument("--fixture", default=WEB_FIXTURE_PATH)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--default", default="Please contact your nephrologist for advice on this question.")
+    args = parser.parse_args()
+    server = ThreadingHTTPServer(("127.0.0.1", args.port), make_stand_in_handler(FixtureProvider(args.fixture, args.default)))
+    print(f"🌐 Tavily stand-in listening on http://127.0.0.1:{args.port}/search")
+    server.serve_forever()